@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+import asyncio
+import importlib.util
+import socket
+import time
+from typing import Dict, List, Tuple
+
+from aiohttp.abc import AbstractResolver
+from aiohttp.resolver import AsyncResolver, ThreadedResolver
+
+
+class CachingResolver(AbstractResolver):
+    """DNS resolver shared by the connection pool that keeps answers for `ttl` seconds
+
+    Lookups go through aiodns when it's installed, and a thread otherwise. Concurrent lookups of the same host
+    share one query"""
+    def __init__(self, ttl: int):
+        self.ttl = ttl
+        self._resolver = AsyncResolver() if importlib.util.find_spec("aiodns") else ThreadedResolver()
+        self._cache: Dict[Tuple[str, int, int], Tuple[float, List[Dict]]] = {}
+        self._in_flight: Dict[Tuple[str, int, int], asyncio.Future] = {}
+
+        self.hits = 0
+        self.misses = 0
+
+    async def resolve(self, host: str, port: int = 0, family: int = socket.AF_INET) -> List[Dict]:
+        """Returns the addresses of a host, from the cache while the answer is fresh"""
+        key = (host, port, family)
+        cached = self._cache.get(key)
+        if cached and time.monotonic() < cached[0]:
+            self.hits += 1
+            return cached[1]
+        if key in self._in_flight:
+            self.hits += 1
+            return await asyncio.shield(self._in_flight[key])
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            addresses = await self._resolver.resolve(host, port, family)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()
+            raise
+        finally:
+            del self._in_flight[key]
+
+        self._cache[key] = (time.monotonic() + self.ttl, addresses)
+        future.set_result(addresses)
+        return addresses
+
+    async def close(self) -> None:
+        """Closes the underlying resolver"""
+        await self._resolver.close()
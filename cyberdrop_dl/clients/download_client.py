@@ -2,18 +2,24 @@ from __future__ import annotations
 
 import asyncio
 import copy
+import errno
+import hashlib
 import itertools
+import json
 import os
+import threading
+import time
+from dataclasses import field, Field
 from http import HTTPStatus
 from functools import wraps, partial
 from pathlib import Path
-from typing import TYPE_CHECKING, Tuple
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
 
 import aiofiles
 import aiohttp
 from aiohttp import ClientSession
 
-from cyberdrop_dl.clients.errors import DownloadFailure, InvalidContentTypeFailure
+from cyberdrop_dl.clients.errors import DownloadFailure, DownloadStalled, InvalidContentTypeFailure, SpaceReserved
 from cyberdrop_dl.utils.utilities import FILE_FORMATS, log
 
 if TYPE_CHECKING:
@@ -24,6 +30,10 @@ if TYPE_CHECKING:
     from cyberdrop_dl.utils.dataclasses.url_objects import MediaItem
 
 
+SEGMENT_CHECKPOINT_SIZE = 8 * 1024 ** 2
+HASH_READ_SIZE = 8 * 1024 ** 2
+
+
 async def is_4xx_client_error(status_code: int) -> bool:
     """Checks whether the HTTP status code is 4xx client error"""
     if isinstance(status_code, str):
@@ -41,11 +51,8 @@ def limiter(func):
         await self._global_limiter.acquire()
         await domain_limiter.acquire()
 
-        async with aiohttp.ClientSession(headers=self._headers, raise_for_status=False,
-                                         cookie_jar=self.client_manager.cookies, timeout=self._timeouts,
-                                         trace_configs=self.trace_configs) as client:
-            kwargs['client_session'] = client
-            return await func(self, *args, **kwargs)
+        kwargs['client_session'] = self._session
+        return await func(self, *args, **kwargs)
     return wrapper
 
 
@@ -74,6 +81,21 @@ class DownloadClient:
             trace_config.on_request_end.append(on_request_end)
             self.trace_configs.append(trace_config)
 
+        self._session: ClientSession = field(init=False)
+        self._write_buffers: List[bytearray] = []
+
+    async def startup(self) -> None:
+        """Opens the long-lived download session on the shared connection pool"""
+        self._session = ClientSession(headers=self._headers, raise_for_status=False, cookie_jar=self.client_manager.cookies,
+                                      timeout=self._timeouts, connector=self.client_manager.connector, connector_owner=False,
+                                      trace_configs=[*self.trace_configs, self.client_manager.get_connection_trace_config(),
+                                                     self.client_manager.request_stats.get_trace_config()])
+
+    async def close(self) -> None:
+        """Closes the download session"""
+        if isinstance(self._session, ClientSession):
+            await self._session.close()
+
     """~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~"""
 
     @limiter
@@ -91,8 +113,13 @@ class DownloadClient:
         media_item.partial_file = download_dir / f"{downloaded_filename}.part"
         
         resume_point = 0
-        if isinstance(media_item.partial_file, Path) and media_item.partial_file.exists():
-            resume_point = media_item.partial_file.stat().st_size if media_item.partial_file.exists() else 0
+        partial_stat, segments_stat = await self.manager.download_manager.stat_files(
+            media_item.partial_file, await self.get_segments_file(media_item.partial_file))
+        if partial_stat and segments_stat:
+            resume_point = await self.get_segments_resume_point(media_item)
+        elif partial_stat:
+            resume_point = partial_stat.st_size
+        if resume_point:
             headers['Range'] = f'bytes={resume_point}-'
 
         await asyncio.sleep(self.client_manager.download_delay)
@@ -100,12 +127,18 @@ class DownloadClient:
         async with client_session.get(media_item.url, headers=headers, ssl=self.client_manager.ssl_context,
                                       proxy=self.client_manager.proxy) as resp:
             if resp.status == HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE:
-                media_item.partial_file.unlink()
+                await self.manager.download_manager.remove_files(media_item.partial_file,
+                                                                 await self.get_segments_file(media_item.partial_file))
                 
-            await self.client_manager.check_http_status(resp, download=True)
+            await self.client_manager.check_http_status(resp, download=True, domain=domain)
             content_type = resp.headers.get('Content-Type')
             
             media_item.filesize = int(resp.headers.get('Content-Length', '0'))
+            encoded = await self.is_encoded(resp)
+            resume_segments = segments_stat is not None and resp.status == HTTPStatus.PARTIAL_CONTENT and not encoded
+            if resume_segments:
+                # Segment state tracks the whole file, the response only holds what's left from the resume point
+                media_item.filesize += resume_point
             if not isinstance(media_item.complete_file, Path):
                 proceed, skip = await self.get_final_file_info(media_item, domain)
                 await self.mark_incomplete(media_item, domain)
@@ -122,34 +155,421 @@ class DownloadClient:
             if content_type and any(s in content_type.lower() for s in ('html', 'text')) and ext not in FILE_FORMATS['Text']:
                 raise InvalidContentTypeFailure(message=f"Received {content_type}, was expecting other")
 
-            if resp.status != HTTPStatus.PARTIAL_CONTENT and media_item.partial_file.is_file():
-                media_item.partial_file.unlink()
+            segments_file = await self.get_segments_file(media_item.partial_file)
+            partial_stat, segments_stat = await self.manager.download_manager.stat_files(media_item.partial_file, segments_file)
+            resume_segments = segments_stat is not None and not encoded and (resume_segments or await self.accepts_ranges(resp))
+            await self.reserve_space(media_item, resume_segments)
+            segment_count = await self.get_segment_count(domain, media_item, resp, resume_point)
+            if resp.status == HTTPStatus.PARTIAL_CONTENT and resume_segments:
+                return await self._download_segments(domain, media_item, headers, segment_count, resp, resume_point)
+            if segment_count > 1 or resume_segments:
+                resp.release()
+                return await self._download_segments(domain, media_item, headers, segment_count)
+            if (segments_stat or (partial_stat and resp.status != HTTPStatus.PARTIAL_CONTENT)
+                    or (resp.status == HTTPStatus.PARTIAL_CONTENT and encoded)):
+                # The server ignored the range, or compressed the body so its offsets aren't the file's, the file starts over
+                await self.manager.download_manager.remove_files(segments_file, media_item.partial_file)
+                if resp.status == HTTPStatus.PARTIAL_CONTENT:
+                    raise DownloadFailure(status=999, message="Compressed response can't resume the file, restarting")
+                partial_stat = None
+                resume_point = 0
+
+            if self.client_manager.preallocate_files and resp.status == HTTPStatus.OK and media_item.filesize and not encoded:
+                # Written at its offset in the preallocated file, with the written length tracked like a segment
+                return await self._download_segments(domain, media_item, headers, 1, resp)
                 
             media_item.task_id = await self.manager.progress_manager.file_progress.add_task(f"({domain.upper()}) {media_item.filename}", media_item.filesize + resume_point)
-            if media_item.partial_file.is_file():
-                resume_point = media_item.partial_file.stat().st_size
+            if partial_stat:
+                resume_point = partial_stat.st_size
                 await self.manager.progress_manager.file_progress.advance_file(media_item.task_id, resume_point)
 
             await save_content(resp.content)
             return True
 
-    async def _append_content(self, media_item, content: aiohttp.StreamReader, update_progress: partial) -> None:
-        """Appends content to a file"""
-        if not await self.client_manager.manager.download_manager.check_free_space():
-            raise DownloadFailure(status="No Free Space", message="Not enough free space")
+    async def reserve_space(self, media_item: MediaItem, segmented: bool) -> None:
+        """Reserves the bytes left to download, so concurrent downloads can't over-commit the drive
 
-        media_item.partial_file.parent.mkdir(parents=True, exist_ok=True)
-        if not media_item.partial_file.is_file():
-            media_item.partial_file.touch()
-        async with aiofiles.open(media_item.partial_file, mode='ab') as f:
-            async for chunk, _ in content.iter_chunks():
-                await asyncio.sleep(0)
-                await f.write(chunk)
-                await update_progress(len(chunk))
-        if not content.total_bytes and not media_item.partial_file.stat().st_size:
-            media_item.partial_file.unlink()
+        Fails if the file can't fit on the drive at all, raises SpaceReserved if it only can't fit alongside the
+        downloads already running"""
+        remaining = max(media_item.filesize - (await self.get_downloaded_size(media_item) if segmented else 0), 0)
+        if not await self.manager.download_manager.check_free_space(remaining):
+            raise DownloadFailure(status="No Free Space", message="Not enough free space")
+        if not await self.manager.download_manager.reserve_space(media_item.partial_file, remaining):
+            raise SpaceReserved()
+
+    async def create_partial_file(self, media_item: MediaItem) -> int:
+        """Creates the part file and its folder if they don't exist, returns its size"""
+        def create() -> int:
+            media_item.partial_file.parent.mkdir(parents=True, exist_ok=True)
+            media_item.partial_file.touch(exist_ok=True)
+            return media_item.partial_file.stat().st_size
+        return await self.manager.download_manager.run_filesystem(create)
+
+    async def _append_content(self, domain: str, media_item: MediaItem, content: aiohttp.StreamReader, update_progress: partial) -> None:
+        """Appends content to a file"""
+        offset = await self.create_partial_file(media_item)
+        started, received = time.monotonic(), 0
+
+        async def on_write(block: memoryview) -> None:
+            nonlocal received
+            size = len(block)
+            await self.hash_block(media_item, offset + received, block)
+            received += size
+            await update_progress(size)
+            await self.manager.download_manager.consume_space(media_item.partial_file, size)
+            await self.manager.download_manager.record_transfer(domain, size)
+
+        try:
+            async with aiofiles.open(media_item.partial_file, mode='ab') as f:
+                await self._write_content(f, content, on_write)
+        except DownloadStalled:
+            self.client_manager.request_stats.record_stall(media_item.url.host)
+            raise
+        finally:
+            self.client_manager.request_stats.record_transfer(media_item.url.host, received, time.monotonic() - started)
+        if not content.total_bytes and not (await self.manager.download_manager.stat_files(media_item.partial_file))[0].st_size:
+            await self.manager.download_manager.remove_files(media_item.partial_file)
             raise DownloadFailure(status=HTTPStatus.INTERNAL_SERVER_ERROR, message="File is empty")
 
+    async def _write_content(self, f, content: aiohttp.StreamReader, on_write: Callable[[memoryview], Coroutine[Any, Any, None]],
+                             limit: Optional[int] = None) -> None:
+        """Copies a response body to a file through a reusable buffer, writing it in large blocks
+
+        `on_write` is called with each block written, which is only valid until it returns, and at most `limit` bytes are copied.
+        Buffered bytes are still written if the stream fails, so they count towards resuming.
+        Raises DownloadStalled if less than `stall_speed_floor` bytes per second arrive over a `stall_window`"""
+        buffer = self._write_buffers.pop() if self._write_buffers else bytearray(self.client_manager.write_buffer_size)
+        view = memoryview(buffer)
+        filled = copied = 0
+        floor, window = self.client_manager.stall_speed_floor, self.client_manager.stall_window
+        window_bytes = 0
+        window_timer: Optional[asyncio.TimerHandle] = None
+
+        def check_window() -> None:
+            # One timer per window instead of a timeout per read, a stall fails the next read of the stream
+            nonlocal window_bytes, window_timer
+            if window_bytes < floor * window:
+                content.set_exception(DownloadStalled(message=f"Received {window_bytes} bytes in {window} seconds"))
+                return
+            window_bytes = 0
+            window_timer = asyncio.get_running_loop().call_later(window, check_window)
+
+        if floor:
+            window_timer = asyncio.get_running_loop().call_later(window, check_window)
+        try:
+            while True:
+                chunk = await content.read(self.client_manager.read_chunk_size)
+                if not chunk:
+                    break
+                window_bytes += len(chunk)
+
+                chunk = memoryview(chunk)
+                if limit is not None:
+                    chunk = chunk[:limit - copied]
+                while chunk:
+                    size = min(len(chunk), len(buffer) - filled)
+                    view[filled:filled + size] = chunk[:size]
+                    filled += size
+                    copied += size
+                    chunk = chunk[size:]
+                    if filled == len(buffer):
+                        await f.write(view)
+                        filled = 0
+                        await on_write(view)
+                if limit is not None and copied >= limit:
+                    break
+        finally:
+            if window_timer:
+                window_timer.cancel()
+            try:
+                if filled:
+                    await f.write(view[:filled])
+                    await on_write(view[:filled])
+            finally:
+                self._write_buffers.append(buffer)
+
+    async def get_segment_count(self, domain: str, media_item: MediaItem, resp: aiohttp.ClientResponse, resume_point: int) -> int:
+        """Returns the number of ranged connections to download the file over, 1 means a single stream"""
+        if resume_point or resp.status != HTTPStatus.OK or not media_item.filesize:
+            return 1
+        if media_item.filesize < self.client_manager.segment_threshold:
+            return 1
+        if not await self.accepts_ranges(resp) or await self.is_encoded(resp):
+            return 1
+        segments = min(self.client_manager.max_segments, await self.manager.download_manager.get_download_limit(domain))
+        return max(segments, 1)
+
+    async def is_encoded(self, resp: aiohttp.ClientResponse) -> bool:
+        """Checks whether the body is compressed, aiohttp decodes it so Content-Length and byte ranges don't count the
+        bytes written to the file"""
+        return resp.headers.get('Content-Encoding', 'identity').lower() != 'identity'
+
+    async def accepts_ranges(self, resp: aiohttp.ClientResponse) -> bool:
+        """Checks whether the server accepts byte range requests for the file"""
+        return resp.headers.get('Accept-Ranges', '').lower() == 'bytes'
+
+    async def get_segments_file(self, partial_file: Path) -> Path:
+        """Returns the path of the file that tracks the progress of each segment of a download"""
+        return partial_file.with_suffix(partial_file.suffix + '.segments')
+
+    async def load_segments(self, media_item: MediaItem, segment_count: int) -> List[List[int]]:
+        """Returns the [start, end, written] state of each segment, resuming a previous attempt if possible"""
+        segments_file = await self.get_segments_file(media_item.partial_file)
+
+        def load() -> Optional[List[List[int]]]:
+            if segments_file.is_file() and media_item.partial_file.is_file():
+                try:
+                    state = json.loads(segments_file.read_text())
+                    if state['size'] == media_item.filesize:
+                        return state['segments']
+                except (ValueError, KeyError):
+                    pass
+            media_item.partial_file.unlink(missing_ok=True)
+            return None
+
+        segments = await self.manager.download_manager.run_filesystem(load)
+        if segments:
+            return segments
+        segment_size = -(-media_item.filesize // segment_count)
+        return [[start, min(start + segment_size, media_item.filesize) - 1, 0]
+                for start in range(0, media_item.filesize, segment_size)]
+
+    async def get_segments_resume_point(self, media_item: MediaItem) -> int:
+        """Returns the first byte a previous segmented attempt hasn't written, 0 if there's nothing to resume"""
+        segments_file = await self.get_segments_file(media_item.partial_file)
+
+        def load() -> int:
+            try:
+                segments = json.loads(segments_file.read_text())['segments']
+            except (OSError, ValueError, KeyError):
+                return 0
+            return next((start + written for start, end, written in segments if start + written <= end), 0)
+        return await self.manager.download_manager.run_filesystem(load)
+
+    async def save_segments(self, media_item: MediaItem, segments: List[List[int]]) -> None:
+        """Writes the progress of each segment so a later attempt can resume them"""
+        segments_file = await self.get_segments_file(media_item.partial_file)
+        state = json.dumps({"size": media_item.filesize, "segments": segments})
+
+        def write() -> None:
+            # Segments checkpoint concurrently, each write replaces the state file whole so it's never left half written
+            temp_file = segments_file.with_name(f"{segments_file.name}.{threading.get_ident()}")
+            temp_file.write_text(state)
+            temp_file.replace(segments_file)
+        await self.manager.download_manager.run_filesystem(write)
+
+    async def preallocate(self, media_item: MediaItem) -> None:
+        """Reserves the full size of a new part file on disk, so it isn't fragmented and a full disk fails up front"""
+        if not self.client_manager.preallocate_files:
+            return
+
+        def allocate() -> bool:
+            with open(media_item.partial_file, 'r+b') as f:
+                if os.fstat(f.fileno()).st_size:
+                    return False
+                if hasattr(os, 'posix_fallocate'):
+                    os.posix_fallocate(f.fileno(), 0, media_item.filesize)
+                else:
+                    f.truncate(media_item.filesize)
+            return True
+
+        try:
+            allocated = await self.manager.download_manager.run_filesystem(allocate)
+        except OSError as e:
+            if e.errno == errno.ENOSPC:
+                await self.manager.download_manager.remove_files(media_item.partial_file)
+                raise DownloadFailure(status="No Free Space", message="Not enough free space")
+            await log(f"Could not preallocate {media_item.partial_file}: {e}", 10)
+            return
+        if allocated:
+            await self.manager.download_manager.consume_space(media_item.partial_file, media_item.filesize)
+
+    async def _download_segments(self, domain: str, media_item: MediaItem, headers: Dict, segment_count: int,
+                                 resp: Optional[aiohttp.ClientResponse] = None, resp_offset: int = 0) -> bool:
+        """Downloads a file over multiple ranged connections, writing each range at its offset in the part file
+
+        When a response starting at byte `resp_offset` is given, it's used for the segment that continues from there
+        instead of a new request"""
+        segments = await self.load_segments(media_item, segment_count)
+        resp_segment = next((segment for segment in segments if segment[0] + segment[2] == resp_offset
+                             and segment[0] + segment[2] <= segment[1]), None) if resp else None
+        if resp and not resp_segment:
+            resp.release()
+            resp = None
+        await self.create_partial_file(media_item)
+        await self.save_segments(media_item, segments)
+        await self.preallocate(media_item)
+
+        media_item.task_id = await self.manager.progress_manager.file_progress.add_task(f"({domain.upper()}) {media_item.filename}", media_item.filesize)
+        written = sum(segment[2] for segment in segments)
+        if written:
+            await self.manager.progress_manager.file_progress.advance_file(media_item.task_id, written)
+        update_progress = partial(self.manager.progress_manager.file_progress.advance_file, media_item.task_id)
+
+        try:
+            async with asyncio.TaskGroup() as task_group:
+                for segment in segments:
+                    task_group.create_task(self._download_segment(domain, media_item, headers, segment, segments, update_progress,
+                                                                  resp if segment is resp_segment else None))
+        except ExceptionGroup as e:
+            raise e.exceptions[0]
+        finally:
+            await self.save_segments(media_item, segments)
+
+        if sum(segment[2] for segment in segments) != media_item.filesize:
+            raise DownloadFailure(status=HTTPStatus.INTERNAL_SERVER_ERROR, message="Segmented download is incomplete")
+        await self.manager.download_manager.remove_files(await self.get_segments_file(media_item.partial_file))
+        return True
+
+    async def _download_segment(self, domain: str, media_item: MediaItem, headers: Dict, segment: List[int],
+                                segments: List[List[int]], update_progress: partial,
+                                resp: Optional[aiohttp.ClientResponse] = None) -> None:
+        """Downloads the remaining bytes of a single segment, starting from `resp` when it's given
+
+        A stalled connection is dropped and the segment reconnects from where it stopped, the stall only fails the
+        download if no bytes were gained since the last connection"""
+        while segment[0] + segment[2] <= segment[1]:
+            written = segment[2]
+            try:
+                if resp:
+                    await self._write_segment(domain, media_item, resp, segment, segments, update_progress)
+                else:
+                    await self._request_segment(domain, media_item, headers, segment, segments, update_progress)
+                return
+            except DownloadStalled:
+                if resp:
+                    resp.close()
+                if segment[2] == written:
+                    raise
+                await log(f"Download Stalled: {media_item.url}, reconnecting from byte {segment[0] + segment[2]}", 20)
+            resp = None
+
+    async def _request_segment(self, domain: str, media_item: MediaItem, headers: Dict, segment: List[int],
+                               segments: List[List[int]], update_progress: partial) -> None:
+        """Requests the remaining range of a segment and writes it"""
+        start, end, _ = segment
+        segment_headers = {**headers, 'Range': f'bytes={start + segment[2]}-{end}'}
+        await (await self.client_manager.get_rate_limiter(domain)).acquire()
+        async with self._session.get(media_item.url, headers=segment_headers, ssl=self.client_manager.ssl_context,
+                                     proxy=self.client_manager.proxy) as resp:
+            await self.client_manager.check_http_status(resp, download=True, domain=domain)
+            if resp.status != HTTPStatus.PARTIAL_CONTENT:
+                raise DownloadFailure(status=resp.status, message="Server did not honor the requested range")
+            await self._write_segment(domain, media_item, resp, segment, segments, update_progress)
+
+    async def _write_segment(self, domain: str, media_item: MediaItem, resp: aiohttp.ClientResponse, segment: List[int],
+                             segments: List[List[int]], update_progress: partial) -> None:
+        """Writes a response body at the segment's offset, checkpointing the segment state as blocks are written"""
+        start, end, _ = segment
+        last_saved = first_byte = segment[2]
+        started = time.monotonic()
+
+        async def on_write(block: memoryview) -> None:
+            nonlocal last_saved
+            size = len(block)
+            await self.hash_block(media_item, start + segment[2], block)
+            segment[2] += size
+            await update_progress(size)
+            await self.manager.download_manager.consume_space(media_item.partial_file, size)
+            await self.manager.download_manager.record_transfer(domain, size)
+            if segment[2] - last_saved >= SEGMENT_CHECKPOINT_SIZE:
+                await self.save_segments(media_item, segments)
+                last_saved = segment[2]
+
+        try:
+            async with aiofiles.open(media_item.partial_file, mode='r+b') as f:
+                await f.seek(start + segment[2])
+                await self._write_content(f, resp.content, on_write, end + 1 - start - segment[2])
+        except DownloadStalled:
+            self.client_manager.request_stats.record_stall(media_item.url.host)
+            raise
+        finally:
+            self.client_manager.request_stats.record_transfer(media_item.url.host, segment[2] - first_byte, time.monotonic() - started)
+
+    async def hash_block(self, media_item: MediaItem, offset: int, block: memoryview) -> None:
+        """Adds a written block to the content hash, blocks are only hashed while they're written in file order"""
+        if offset == 0:
+            media_item.hasher, media_item.hashed_bytes = hashlib.blake2b(), 0
+        if offset != media_item.hashed_bytes:
+            return
+        await self.manager.download_manager.run_filesystem(media_item.hasher.update, block)
+        media_item.hashed_bytes += len(block)
+
+    async def finish_hash(self, media_item: MediaItem) -> None:
+        """Sets the content hash and size of a finished part file
+
+        Bytes that weren't hashed as they were written (later segments, resumed files) are read back from disk, which is
+        only done when dedupe is enabled, the hash is left empty otherwise and find_duplicate skips the file"""
+        media_item.filesize = (await self.manager.download_manager.stat_files(media_item.partial_file))[0].st_size
+        media_item.content_hash = None
+        if media_item.hashed_bytes == media_item.filesize and media_item.hashed_bytes:
+            media_item.content_hash = media_item.hasher.hexdigest()
+            return
+        if await self.manager.download_manager.get_dedupe_mode() == "off":
+            return
+
+        def hash_rest() -> str:
+            hasher = media_item.hasher if media_item.hashed_bytes else hashlib.blake2b()
+            with open(media_item.partial_file, 'rb') as f:
+                f.seek(media_item.hashed_bytes)
+                while block := f.read(HASH_READ_SIZE):
+                    hasher.update(block)
+            return hasher.hexdigest()
+        media_item.content_hash = await self.manager.download_manager.run_filesystem(hash_rest)
+
+    async def find_duplicate(self, media_item: MediaItem) -> Optional[Path]:
+        """Returns an earlier download with the same content as the media item, if dedupe is enabled"""
+        if not media_item.content_hash or await self.manager.download_manager.get_dedupe_mode() == "off":
+            return None
+        paths = await self.manager.db_manager.history_table.get_files_by_hash(media_item.content_hash, media_item.filesize)
+        paths = [path for path in paths if path != media_item.complete_file]
+        for path, stat in zip(paths, await self.manager.download_manager.stat_files(*paths)):
+            if stat and stat.st_size == media_item.filesize:
+                return path
+        return None
+
+    async def link_known_duplicate(self, domain: str, media_item: MediaItem) -> bool:
+        """Uses the hash given by the host's API to link or skip a file that was already downloaded from another album,
+        without downloading it again"""
+        dedupe_mode = await self.manager.download_manager.get_dedupe_mode()
+        if not media_item.host_hash or dedupe_mode == "off":
+            return False
+        rows = await self.manager.db_manager.history_table.get_files_by_host_hash(media_item.host_hash)
+        if not rows:
+            return False
+        stats = await self.manager.download_manager.stat_files(*(row[0] for row in rows))
+        source = next((row for row, stat in zip(rows, stats) if stat and (row[2] is None or stat.st_size == row[2])), None)
+        if not source:
+            return False
+
+        complete_file = await self.get_download_dir(media_item) / media_item.filename
+        if complete_file == source[0] or (await self.manager.download_manager.stat_files(complete_file))[0]:
+            return False
+        if dedupe_mode != "skip" and not await self.manager.download_manager.link_duplicate(source[0], complete_file):
+            return False
+
+        media_item.complete_file = complete_file
+        media_item.download_filename = complete_file.name
+        _, media_item.content_hash, media_item.filesize = source
+        await log(f"Skipping {media_item.url} as it's a duplicate of {source[0]} ({dedupe_mode})", 10)
+        await self.manager.progress_manager.download_progress.add_previously_completed(False)
+        await self.mark_incomplete(media_item, domain)
+        await self.mark_completed(media_item, domain)
+        return True
+
+    async def get_downloaded_size(self, media_item: MediaItem) -> int:
+        """Returns the number of bytes of the media item that have been written so far"""
+        segments_file = await self.get_segments_file(media_item.partial_file)
+
+        def get_size() -> int:
+            if segments_file.is_file():
+                try:
+                    return sum(segment[2] for segment in json.loads(segments_file.read_text())['segments'])
+                except (ValueError, KeyError):
+                    return 0
+            return media_item.partial_file.stat().st_size if media_item.partial_file.is_file() else 0
+        return await self.manager.download_manager.run_filesystem(get_size)
+
     async def download_file(self, manager: Manager, domain: str, media_item: MediaItem) -> bool:
         """Starts a file"""
         if self.manager.config_manager.settings_data['Download_Options']['skip_download_mark_completed']:
@@ -158,18 +578,38 @@ class DownloadClient:
             await self.mark_incomplete(media_item, domain)
             await self.mark_completed(media_item, domain)
             return False
-        
+
+        if await self.link_known_duplicate(domain, media_item):
+            return False
+
         async def save_content(content: aiohttp.StreamReader) -> None:
-            await self._append_content(media_item, content, partial(manager.progress_manager.file_progress.advance_file, media_item.task_id))
+            await self._append_content(domain, media_item, content, partial(manager.progress_manager.file_progress.advance_file, media_item.task_id))
 
-        downloaded = await self._download(domain, manager, media_item, save_content)
+        try:
+            downloaded = await self._download(domain, manager, media_item, save_content)
+        finally:
+            if isinstance(media_item.partial_file, Path):
+                await self.manager.download_manager.release_space(media_item.partial_file)
         if downloaded:
-            media_item.partial_file.rename(media_item.complete_file)
+            await self.finish_hash(media_item)
+            duplicate_of = await self.find_duplicate(media_item)
+            if duplicate_of:
+                await log(f"{media_item.complete_file} is a duplicate of {duplicate_of}", 10)
+            await self.manager.download_manager.finalize_file(media_item.partial_file, media_item.complete_file,
+                                                              await self.get_file_datetime(media_item), duplicate_of)
             await self.mark_completed(media_item, domain)
         return downloaded
         
     """~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~"""
     
+    async def get_file_datetime(self, media_item: MediaItem) -> Optional[str]:
+        """Returns the date to set on the downloaded file, if there is one and file timestamps are enabled"""
+        if self.manager.config_manager.settings_data['Download_Options']['disable_file_timestamps']:
+            return None
+        if isinstance(media_item.datetime, Field):
+            return None
+        return media_item.datetime
+
     async def mark_incomplete(self, media_item: MediaItem, domain: str) -> None:
         """Marks the media item as incomplete in the database"""
         await self.manager.db_manager.history_table.insert_incompleted(domain, media_item)
@@ -203,17 +643,19 @@ class DownloadClient:
         skip = False
         while True:
             if expected_size:
-                file_size_check = await self.check_filesize_limits(media_item)
+                file_size_check = await self.manager.download_manager.check_filesize_limits(media_item, media_item.filesize)
                 if not file_size_check:
                     await log(f"Download Skip {media_item.url} due to filesize restrictions", 10)
                     proceed = False
                     skip = True
                     return proceed, skip
 
-            if not media_item.complete_file.exists() and not media_item.partial_file.exists():
+            complete_stat, partial_stat, segments_stat = await self.manager.download_manager.stat_files(
+                media_item.complete_file, media_item.partial_file, await self.get_segments_file(media_item.partial_file))
+            if not complete_stat and not partial_stat:
                 break
 
-            if media_item.complete_file.exists() and media_item.complete_file.stat().st_size == media_item.filesize:
+            if complete_stat and complete_stat.st_size == media_item.filesize:
                 proceed = False
                 break
 
@@ -223,22 +665,23 @@ class DownloadClient:
                 break
 
             if media_item.filename == downloaded_filename:
-                if media_item.partial_file.exists():
-                    if media_item.partial_file.stat().st_size >= media_item.filesize != 0:
-                        media_item.partial_file.unlink()
-                    if media_item.partial_file.stat().st_size == media_item.filesize:
-                        if media_item.complete_file.exists():
+                if partial_stat and not segments_stat:
+                    if partial_stat.st_size >= media_item.filesize != 0:
+                        await self.manager.download_manager.remove_files(media_item.partial_file)
+                        partial_stat = None
+                    if partial_stat and partial_stat.st_size == media_item.filesize:
+                        if complete_stat:
                             new_complete_filename, new_partial_file = await self.iterate_filename(media_item.complete_file, media_item)
-                            media_item.partial_file.rename(new_complete_filename)
+                            await self.manager.download_manager.run_filesystem(media_item.partial_file.rename, new_complete_filename)
                             proceed = False
 
                             media_item.complete_file = new_complete_filename
                             media_item.partial_file = new_partial_file
                         else:
                             proceed = False
-                            media_item.partial_file.rename(media_item.complete_file)
-                elif media_item.complete_file.exists():
-                    if media_item.complete_file.stat().st_size == media_item.filesize:
+                            await self.manager.download_manager.run_filesystem(media_item.partial_file.rename, media_item.complete_file)
+                elif complete_stat:
+                    if complete_stat.st_size == media_item.filesize:
                         proceed = False
                     else:
                         media_item.complete_file, media_item.partial_file = await self.iterate_filename(media_item.complete_file, media_item)
@@ -254,44 +697,9 @@ class DownloadClient:
         for iteration in itertools.count(1):
             filename = f"{complete_file.stem} ({iteration}){media_item.ext}"
             temp_complete_file = media_item.download_folder / filename
-            if not temp_complete_file.exists() and not await self.manager.db_manager.history_table.check_filename_exists(filename):
+            if not await self.manager.download_manager.run_filesystem(temp_complete_file.exists) and not await self.manager.db_manager.history_table.check_filename_exists(filename):
                 media_item.filename = filename
                 complete_file = media_item.download_folder / media_item.filename
                 partial_file = complete_file.with_suffix(complete_file.suffix + '.part')
                 break
         return complete_file, partial_file
-    
-    async def check_filesize_limits(self, media: MediaItem) -> bool:
-        """Checks if the file size is within the limits"""
-        max_video_filesize = self.manager.config_manager.settings_data['File_Size_Limits']['maximum_video_size']
-        min_video_filesize = self.manager.config_manager.settings_data['File_Size_Limits']['minimum_video_size']
-        max_image_filesize = self.manager.config_manager.settings_data['File_Size_Limits']['maximum_image_size']
-        min_image_filesize = self.manager.config_manager.settings_data['File_Size_Limits']['minimum_image_size']
-        max_other_filesize = self.manager.config_manager.settings_data['File_Size_Limits']['maximum_other_size']
-        min_other_filesize = self.manager.config_manager.settings_data['File_Size_Limits']['minimum_other_size']
-
-        if media.ext in FILE_FORMATS['Images']:
-            if max_image_filesize and min_image_filesize:
-                if media.filesize < min_image_filesize or media.filesize > max_image_filesize:
-                    return False
-            if media.filesize < min_image_filesize:
-                return False
-            if max_image_filesize and media.filesize > max_image_filesize:
-                return False
-        elif media.ext in FILE_FORMATS['Videos']:
-            if max_video_filesize and min_video_filesize:
-                if media.filesize < min_video_filesize or media.filesize > max_video_filesize:
-                    return False
-            if media.filesize < min_video_filesize:
-                return False
-            if max_video_filesize and media.filesize > max_video_filesize:
-                return False
-        else:
-            if max_other_filesize and min_other_filesize:
-                if media.filesize < min_other_filesize or media.filesize > max_other_filesize:
-                    return False
-            if media.filesize < min_other_filesize:
-                return False
-            if max_other_filesize and media.filesize > max_other_filesize:
-                return False
-        return True
@@ -31,13 +31,28 @@ class DDOSGuardFailure(Exception):
 
 class DownloadFailure(Exception):
     """This error will be thrown when a request fails"""
-    def __init__(self, status: int, message: str = "Something went wrong"):
+    def __init__(self, status: int, message: str = "Something went wrong", retry_after: float = None):
         self.status = status
         self.message = message
+        self.retry_after = retry_after
         super().__init__(self.message)
         super().__init__(self.status)
 
 
+class DownloadStalled(Exception):
+    """This error will be thrown when a download stays below the stall speed floor for a whole window"""
+    def __init__(self, message: str = "Download stalled"):
+        self.message = message
+        super().__init__(self.message)
+
+
+class SpaceReserved(Exception):
+    """This error will be thrown when the free space a download needs is reserved by running downloads"""
+    def __init__(self, message: str = "Free space is reserved by running downloads"):
+        self.message = message
+        super().__init__(self.message)
+
+
 class ScrapeFailure(Exception):
     """This error will be thrown when a request fails"""
     def __init__(self, status: int, message: str = "Something went wrong"):
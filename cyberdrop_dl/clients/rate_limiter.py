@@ -0,0 +1,46 @@
+from __future__ import annotations
+
+import time
+
+from aiolimiter import AsyncLimiter
+
+
+class AdaptiveLimiter(AsyncLimiter):
+    """A leaky bucket rate limiter that adapts its rate to server feedback (AIMD)
+
+    The rate grows additively while responses are healthy, and is cut multiplicatively when the server
+    signals that it is being overloaded (429, 503, 521, DDoS-Guard)"""
+
+    increase_per_second = 0.5
+    decrease_factor = 0.5
+    decrease_cooldown = 2
+
+    def __init__(self, rate: float, ceiling: float, floor: float = 0.2):
+        super().__init__(1, 1)
+        self.ceiling = ceiling
+        self.floor = min(floor, ceiling)
+        self.rate: float = 0
+        self._last_decrease = 0.0
+        self.set_rate(rate)
+
+    def set_rate(self, rate: float) -> None:
+        """Sets the number of requests per second allowed by the limiter"""
+        rate = min(max(rate, self.floor), self.ceiling)
+        self.rate = rate
+        self.max_rate = max(rate, 1)
+        self.time_period = self.max_rate / rate
+        self._rate_per_sec = rate
+
+    async def on_success(self) -> None:
+        """Raises the rate so that it grows by `increase_per_second` for every second of healthy responses"""
+        if self.rate < self.ceiling:
+            self.set_rate(self.rate + self.increase_per_second / self.rate)
+
+    async def on_throttle(self) -> bool:
+        """Cuts the rate, bursts of errors from the same window only count once"""
+        now = time.monotonic()
+        if now - self._last_decrease < self.decrease_cooldown:
+            return False
+        self._last_decrease = now
+        self.set_rate(self.rate * self.decrease_factor)
+        return True
@@ -0,0 +1,166 @@
+from __future__ import annotations
+
+import bisect
+import json
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List
+
+import aiohttp
+
+# Upper bounds of the histogram buckets, in milliseconds
+BUCKET_BOUNDS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+
+@dataclass
+class Histogram:
+    """Fixed bucket histogram of durations, cheap enough to update on every request"""
+    counts: List[int] = field(default_factory=lambda: [0] * (len(BUCKET_BOUNDS_MS) + 1))
+    total: float = 0
+    maximum: float = 0
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def add(self, seconds: float) -> None:
+        """Adds a duration to the histogram"""
+        ms = seconds * 1000
+        self.counts[bisect.bisect_left(BUCKET_BOUNDS_MS, ms)] += 1
+        self.total += ms
+        self.maximum = max(self.maximum, ms)
+
+    def percentile(self, q: float) -> float:
+        """Returns the upper bound of the bucket holding the q-th percentile, in milliseconds"""
+        count = self.count
+        if not count:
+            return 0
+        seen = 0
+        for bound, bucket_count in zip(BUCKET_BOUNDS_MS, self.counts):
+            seen += bucket_count
+            if seen >= q * count:
+                return min(bound, self.maximum)
+        return self.maximum
+
+    def to_dict(self) -> Dict:
+        count = self.count
+        return {"count": count, "mean_ms": round(self.total / count, 1) if count else 0,
+                "p50_ms": round(self.percentile(0.5), 1), "p95_ms": round(self.percentile(0.95), 1), "max_ms": round(self.maximum, 1),
+                "buckets": {f"le_{bound}": bucket_count for bound, bucket_count in zip(BUCKET_BOUNDS_MS, self.counts)} | {"inf": self.counts[-1]}}
+
+
+@dataclass
+class HostStats:
+    """Latency, status and throughput measurements of a single host"""
+    requests: int = 0
+    bytes: int = 0
+    dns: Histogram = field(default_factory=Histogram)
+    connect: Histogram = field(default_factory=Histogram)
+    ttfb: Histogram = field(default_factory=Histogram)
+    transfer: Histogram = field(default_factory=Histogram)
+    transfer_seconds: float = 0
+    statuses: Counter = field(default_factory=Counter)
+    errors: Counter = field(default_factory=Counter)
+    stalls: int = 0
+
+    @property
+    def throughput(self) -> float:
+        """Average bytes per second while receiving response bodies"""
+        return self.bytes / self.transfer_seconds if self.transfer_seconds else 0
+
+    def to_dict(self) -> Dict:
+        return {"requests": self.requests, "bytes": self.bytes, "throughput_bytes_per_second": round(self.throughput),
+                "dns": self.dns.to_dict(), "connect": self.connect.to_dict(), "ttfb": self.ttfb.to_dict(),
+                "transfer": self.transfer.to_dict(), "statuses": dict(self.statuses), "errors": dict(self.errors), "stalls": self.stalls}
+
+
+class RequestStats:
+    """Collects per host timings of every request made by the scrape and download sessions
+
+    DNS, connect (which includes the TLS handshake, aiohttp doesn't time it separately) and time to first byte come
+    from aiohttp trace signals. Bodies read with `response.read()` are timed by the trace too, streamed download bodies
+    are reported by the download client with `record_transfer`"""
+    def __init__(self):
+        self.hosts: Dict[str, HostStats] = {}
+        self.started = time.time()
+
+    def get_host(self, host: str) -> HostStats:
+        if host not in self.hosts:
+            self.hosts[host] = HostStats()
+        return self.hosts[host]
+
+    def get_trace_config(self) -> aiohttp.TraceConfig:
+        """Returns a trace config that records the timings of each request"""
+        async def on_request_start(session, ctx, params):
+            ctx.host = params.url.host or ""
+            ctx.sent_at = ctx.dns_start = ctx.connect_start = ctx.headers_at = time.monotonic()
+            ctx.dns_time = 0
+            self.get_host(ctx.host).requests += 1
+
+        async def on_dns_resolvehost_start(session, ctx, params):
+            ctx.dns_start = time.monotonic()
+
+        async def on_dns_resolvehost_end(session, ctx, params):
+            ctx.dns_time = time.monotonic() - ctx.dns_start
+            self.get_host(ctx.host).dns.add(ctx.dns_time)
+
+        async def on_connection_create_start(session, ctx, params):
+            ctx.connect_start = time.monotonic()
+
+        async def on_connection_create_end(session, ctx, params):
+            self.get_host(ctx.host).connect.add(time.monotonic() - ctx.connect_start - ctx.dns_time)
+
+        async def on_request_headers_sent(session, ctx, params):
+            ctx.sent_at = time.monotonic()
+
+        async def on_request_end(session, ctx, params):
+            ctx.headers_at = time.monotonic()
+            host_stats = self.get_host(ctx.host)
+            host_stats.ttfb.add(ctx.headers_at - ctx.sent_at)
+            host_stats.statuses[str(params.response.status)] += 1
+
+        async def on_response_chunk_received(session, ctx, params):
+            self.record_transfer(ctx.host, len(params.chunk), time.monotonic() - ctx.headers_at)
+
+        async def on_request_exception(session, ctx, params):
+            self.get_host(ctx.host).errors[type(params.exception).__name__] += 1
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_start.append(on_request_start)
+        trace_config.on_dns_resolvehost_start.append(on_dns_resolvehost_start)
+        trace_config.on_dns_resolvehost_end.append(on_dns_resolvehost_end)
+        trace_config.on_connection_create_start.append(on_connection_create_start)
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        trace_config.on_request_headers_sent.append(on_request_headers_sent)
+        trace_config.on_request_end.append(on_request_end)
+        trace_config.on_response_chunk_received.append(on_response_chunk_received)
+        trace_config.on_request_exception.append(on_request_exception)
+        return trace_config
+
+    def record_transfer(self, host: str, size: int, seconds: float) -> None:
+        """Records a response body received from a host"""
+        host_stats = self.get_host(host)
+        host_stats.bytes += size
+        host_stats.transfer.add(seconds)
+        host_stats.transfer_seconds += seconds
+
+    def record_stall(self, host: str) -> None:
+        """Records a download from a host that stalled and was reconnected or failed"""
+        self.get_host(host).stalls += 1
+
+    def get_slowest_hosts(self, limit: int = 10) -> List[tuple[str, HostStats]]:
+        """Returns the hosts we spent the most time waiting on"""
+        def time_spent(host_stats: HostStats) -> float:
+            return host_stats.dns.total + host_stats.connect.total + host_stats.ttfb.total + host_stats.transfer.total
+        return sorted(self.hosts.items(), key=lambda item: time_spent(item[1]), reverse=True)[:limit]
+
+    def to_dict(self) -> Dict:
+        return {"started": self.started, "finished": time.time(),
+                "hosts": {host: host_stats.to_dict() for host, host_stats in sorted(self.hosts.items())}}
+
+    async def write_json(self, path: Path) -> None:
+        """Writes the stats of every host to a JSON file"""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(self.to_dict(), indent=4))
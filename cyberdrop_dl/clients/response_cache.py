@@ -0,0 +1,159 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import time
+import zlib
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Optional
+
+import aiosqlite
+from yarl import URL
+
+from cyberdrop_dl.utils.database.table_definitions import create_response_cache
+from cyberdrop_dl.utils.utilities import log_debug
+
+if TYPE_CHECKING:
+    from aiohttp import ClientResponse
+
+
+@dataclass
+class CachedResponse:
+    key: str
+    text: str
+    response_url: URL
+    etag: Optional[str]
+    last_modified: Optional[str]
+    stored_at: float
+
+    @property
+    def validators(self) -> Dict[str, str]:
+        """Returns the headers used to revalidate the cached response with the server"""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class ResponseCache:
+    """On-disk cache of scrape responses, revalidated with the server using ETag / Last-Modified"""
+    def __init__(self, db_path: Path, max_size: int):
+        self._db_path = db_path
+        self._db_conn: aiosqlite.Connection = field(init=False)
+        self.max_size = max_size
+        self.enabled = max_size > 0
+        self.size = 0
+
+        # Seconds a response is served without revalidating it, for pages that don't change once created
+        self.domain_ttls = {"e-hentai": 86400, "imageban": 86400, "imgbox": 86400, "imgur": 86400,
+                            "pimpandhost": 86400, "postimg": 86400, "other": 0}
+
+        self.hits = 0
+        self.revalidated = 0
+
+        # Last access time of the responses served since the last eviction, written in one batch when it runs
+        self._accessed: Dict[str, float] = {}
+
+    async def startup(self) -> None:
+        """Opens the cache database"""
+        if not self.enabled:
+            return
+        self._db_conn = await aiosqlite.connect(self._db_path)
+        await self._db_conn.execute(create_response_cache)
+        await self._db_conn.commit()
+        result = await self._db_conn.execute("""SELECT COALESCE(SUM(size), 0) FROM responses""")
+        self.size = (await result.fetchone())[0]
+        await self.evict()
+
+    async def close(self) -> None:
+        """Closes the cache database"""
+        if not self.enabled or not isinstance(self._db_conn, aiosqlite.Connection):
+            return
+        await self.write_accessed()
+        await log_debug(f"Response cache: {self.hits} fresh hits, {self.revalidated} revalidated, {self.size / 1024 ** 2:.1f} MB stored", 10)
+        await self._db_conn.close()
+
+    async def get_ttl(self, domain: str) -> int:
+        """Returns the number of seconds a response for the domain is considered fresh"""
+        return self.domain_ttls.get(domain, self.domain_ttls["other"])
+
+    async def make_key(self, url: URL, headers: Dict, params: Optional[Dict] = None, kind: str = "text") -> str:
+        """Returns the cache key for a request, based on the URL, the headers that change the response and the kind
+        of response the caller expects (json, html or text), so a body stored for one kind isn't served as another"""
+        relevant_headers = {k.lower(): v for k, v in headers.items() if k.lower() in ("accept", "authorization", "x-api-key")}
+        key = json.dumps([kind, str(url), params or {}, relevant_headers], sort_keys=True, default=str)
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    async def get(self, key: str) -> Optional[CachedResponse]:
+        """Returns the cached response for the key, if there is one"""
+        if not self.enabled:
+            return None
+        result = await self._db_conn.execute("""SELECT response_url, etag, last_modified, body, stored_at FROM responses WHERE key = ?""", (key,))
+        row = await result.fetchone()
+        if not row:
+            return None
+        self._accessed[key] = time.time()
+        return CachedResponse(key, zlib.decompress(row[3]).decode('utf-8'), URL(row[0]), row[1], row[2], row[4])
+
+    async def is_fresh(self, domain: str, cached: CachedResponse) -> bool:
+        """Checks whether the cached response can be used without asking the server"""
+        return time.time() - cached.stored_at < await self.get_ttl(domain)
+
+    async def store(self, key: str, domain: str, url: URL, response: ClientResponse, text: str) -> None:
+        """Stores a response if the server allows it and it can be revalidated or has a TTL"""
+        if not self.enabled:
+            return
+        if "no-store" in response.headers.get('Cache-Control', '').lower():
+            return
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if not etag and not last_modified and not await self.get_ttl(domain):
+            return
+
+        body = zlib.compress(text.encode('utf-8'))
+        if len(body) > self.max_size:
+            return
+        now = time.time()
+        self._accessed.pop(key, None)
+        result = await self._db_conn.execute("""SELECT size FROM responses WHERE key = ?""", (key,))
+        previous = await result.fetchone()
+        await self._db_conn.execute("""INSERT OR REPLACE INTO responses (key, domain, url, response_url, etag, last_modified, body, size, stored_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                                    (key, domain, str(url), str(response.url), etag, last_modified, body, len(body), now, now))
+        await self._db_conn.commit()
+        self.size += len(body) - (previous[0] if previous else 0)
+        await self.evict()
+
+    async def refresh(self, cached: CachedResponse) -> None:
+        """Marks a cached response as fresh after the server confirmed it hasn't changed"""
+        self.revalidated += 1
+        await self._db_conn.execute("""UPDATE responses SET stored_at = ? WHERE key = ?""", (time.time(), cached.key))
+        await self._db_conn.commit()
+
+    async def write_accessed(self) -> None:
+        """Writes the batched access times of the responses served from the cache"""
+        if not self._accessed:
+            return
+        accessed, self._accessed = self._accessed, {}
+        await self._db_conn.executemany("""UPDATE responses SET accessed_at = ? WHERE key = ?""",
+                                        [(accessed_at, key) for key, accessed_at in accessed.items()])
+        await self._db_conn.commit()
+
+    async def evict(self) -> None:
+        """Removes the least recently used responses until the cache fits in its size limit"""
+        if self.size > self.max_size:
+            await self.write_accessed()
+        while self.size > self.max_size:
+            result = await self._db_conn.execute("""SELECT key, size FROM responses ORDER BY accessed_at LIMIT 100""")
+            rows = await result.fetchall()
+            if not rows:
+                self.size = 0
+                break
+            for key, size in rows:
+                await self._db_conn.execute("""DELETE FROM responses WHERE key = ?""", (key,))
+                self.size -= size
+                if self.size <= self.max_size:
+                    break
+            await self._db_conn.commit()
@@ -1,23 +1,38 @@
 from __future__ import annotations
 
+import asyncio
 import json
 import os
+import time
 
 import aiohttp
+from dataclasses import field
 from functools import wraps
-from typing import TYPE_CHECKING, Dict, Optional
+from http import HTTPStatus
+from typing import TYPE_CHECKING, Callable, Dict, Hashable, Optional, Tuple, TypeVar
 
 from aiohttp import ClientSession
 from bs4 import BeautifulSoup
 from multidict import CIMultiDictProxy
 from yarl import URL
 
-from cyberdrop_dl.clients.errors import InvalidContentTypeFailure, DDOSGuardFailure, ScrapeFailure
-from cyberdrop_dl.utils.utilities import log
+from cyberdrop_dl.clients.errors import InvalidContentTypeFailure, DDOSGuardFailure, DownloadFailure, ScrapeFailure
+from cyberdrop_dl.utils.utilities import log, log_debug
 
 if TYPE_CHECKING:
+    from cyberdrop_dl.clients.response_cache import CachedResponse
     from cyberdrop_dl.managers.client_manager import ClientManager
 
+TEXT_CONTENT_TYPES = ("html", "text")
+JSON_CONTENT_TYPES = ("json",)
+
+T = TypeVar("T")
+
+
+def parse_and_extract(text: str, extractor: Callable[[BeautifulSoup], T], parser: str) -> T:
+    """Parses a page and runs the extractor on it, this is what the HTML parser worker processes run"""
+    return extractor(BeautifulSoup(text, parser))
+
 
 def limiter(func):
     """Wrapper handles limits for scrape session"""
@@ -28,11 +43,8 @@ def limiter(func):
             await self._global_limiter.acquire()
             await domain_limiter.acquire()
 
-            async with aiohttp.ClientSession(headers=self._headers, raise_for_status=False,
-                                             cookie_jar=self.client_manager.cookies, timeout=self._timeouts,
-                                             trace_configs=self.trace_configs) as client:
-                kwargs['client_session'] = client
-                return await func(self, *args, **kwargs)
+            kwargs['client_session'] = self._session
+            return await func(self, *args, **kwargs)
     return wrapper
 
 
@@ -58,7 +70,29 @@ class ScraperClient:
             trace_config.on_request_start.append(on_request_start)
             trace_config.on_request_end.append(on_request_end)
             self.trace_configs.append(trace_config)
-            
+
+        self._session: ClientSession = field(init=False)
+
+        # Identical GETs share one request while it's in flight, and its result for a few seconds after
+        self._in_flight: Dict[Hashable, asyncio.Future] = {}
+        self._memo: Dict[Hashable, Tuple[float, Tuple[str, URL]]] = {}
+        self.memo_ttl = 10
+        self.memo_size = 64
+        self.coalesced = 0
+
+    async def startup(self) -> None:
+        """Opens the long-lived scrape session on the shared connection pool"""
+        self._session = ClientSession(headers=self._headers, raise_for_status=False, cookie_jar=self.client_manager.cookies,
+                                      timeout=self._timeouts, connector=self.client_manager.connector, connector_owner=False,
+                                      trace_configs=[*self.trace_configs, self.client_manager.get_connection_trace_config(),
+                                                     self.client_manager.request_stats.get_trace_config()])
+
+    async def close(self) -> None:
+        """Closes the scrape session"""
+        if isinstance(self._session, ClientSession):
+            await self._session.close()
+        await log_debug(f"Scrape requests coalesced: {self.coalesced}", 10)
+
     @limiter
     async def flaresolverr(self, domain: str, url: URL, client_session: ClientSession) -> str:
         """Returns the resolved URL from the given URL"""
@@ -77,77 +111,152 @@ class ScraperClient:
             
             return json_obj.get("solution").get("response")
 
+    async def _get(self, domain: str, url: URL, headers: Optional[Dict] = None, params: Optional[Dict] = None,
+                   content_types: Optional[Tuple[str, ...]] = None, use_flaresolverr: bool = False) -> Tuple[str, URL]:
+        """Returns the text and response URL for a GET request, served from the response cache while it's fresh
+
+        Concurrent identical requests share a single network call, and its result is reused for `memo_ttl` seconds"""
+        headers = headers or self._headers
+        kind = "json" if content_types == JSON_CONTENT_TYPES else "html" if content_types == TEXT_CONTENT_TYPES else "text"
+        cache_key = await self.client_manager.response_cache.make_key(url, headers, params, kind)
+        flight_key = (cache_key, content_types, use_flaresolverr)
+
+        memo = self._memo.get(flight_key)
+        if memo and time.monotonic() - memo[0] < self.memo_ttl:
+            self.coalesced += 1
+            return memo[1]
+        if flight_key in self._in_flight:
+            self.coalesced += 1
+            in_flight = self._in_flight[flight_key]
+            try:
+                return await asyncio.shield(in_flight)
+            except asyncio.CancelledError:
+                # Only the caller that made the request was cancelled, this one makes it again
+                if not in_flight.cancelled() or asyncio.current_task().cancelling():
+                    raise
+            self.coalesced -= 1
+            return await self._get(domain, url, headers, params, content_types, use_flaresolverr)
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[flight_key] = future
+        try:
+            cached = await self.client_manager.response_cache.get(cache_key)
+            if cached and await self.client_manager.response_cache.is_fresh(domain, cached):
+                self.client_manager.response_cache.hits += 1
+                result = cached.text, cached.response_url
+            else:
+                result = await self._request(domain, url, cache_key, cached, headers, params, content_types, use_flaresolverr)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved, there may be no other callers waiting on it
+            future.exception()
+            raise
+        finally:
+            del self._in_flight[flight_key]
+
+        future.set_result(result)
+        await self.memoize(flight_key, result)
+        return result
+
+    async def memoize(self, flight_key: Hashable, result: Tuple[str, URL]) -> None:
+        """Keeps a completed result for a few seconds, dropping expired and oldest entries"""
+        now = time.monotonic()
+        self._memo = {k: v for k, v in self._memo.items() if now - v[0] < self.memo_ttl}
+        while len(self._memo) >= self.memo_size:
+            del self._memo[next(iter(self._memo))]
+        self._memo[flight_key] = (now, result)
+
     @limiter
-    async def get_BS4(self, domain: str, url: URL, client_session: ClientSession) -> BeautifulSoup:
-        """Returns a BeautifulSoup object from the given URL"""
-        async with client_session.get(url, headers=self._headers, ssl=self.client_manager.ssl_context,
-                                      proxy=self.client_manager.proxy) as response:
+    async def _request(self, domain: str, url: URL, cache_key: str, cached: Optional[CachedResponse], headers: Dict,
+                       params: Optional[Dict], content_types: Optional[Tuple[str, ...]], use_flaresolverr: bool,
+                       client_session: ClientSession) -> Tuple[str, URL]:
+        """Performs a GET request, revalidating the cached response if there is one"""
+        request_headers = {**headers, **cached.validators} if cached else headers
+        async with client_session.get(url, headers=request_headers, ssl=self.client_manager.ssl_context,
+                                      proxy=self.client_manager.proxy, params=params) as response:
+            if cached and response.status == HTTPStatus.NOT_MODIFIED:
+                await self.client_manager.response_cache.refresh(cached)
+                return cached.text, cached.response_url
             try:
-                await self.client_manager.check_http_status(response)
+                await self.client_manager.check_http_status(response, domain=domain)
             except DDOSGuardFailure:
+                if not use_flaresolverr:
+                    raise
                 response_text = await self.flaresolverr(domain, url)
-                return BeautifulSoup(response_text, 'html.parser')
-            content_type = response.headers.get('Content-Type')
-            assert content_type is not None
-            if not any(s in content_type.lower() for s in ("html", "text")):
-                raise InvalidContentTypeFailure(message=f"Received {content_type}, was expecting text")
+                return response_text, URL(response.url)
+            if content_types:
+                content_type = response.headers.get('Content-Type')
+                assert content_type is not None
+                if not any(s in content_type.lower() for s in content_types):
+                    expected = "JSON" if content_types == JSON_CONTENT_TYPES else "text"
+                    raise InvalidContentTypeFailure(message=f"Received {content_type}, was expecting {expected}")
             text = await response.text()
-            return BeautifulSoup(text, 'html.parser')
+            await self.client_manager.response_cache.store(cache_key, domain, url, response, text)
+            return text, URL(response.url)
 
-    @limiter
-    async def get_BS4_and_return_URL(self, domain: str, url: URL, client_session: ClientSession) -> tuple[BeautifulSoup, URL]:
+    async def get_BS4(self, domain: str, url: URL) -> BeautifulSoup:
+        """Returns a BeautifulSoup object from the given URL"""
+        text, _ = await self._get(domain, url, content_types=TEXT_CONTENT_TYPES, use_flaresolverr=True)
+        return BeautifulSoup(text, self.client_manager.html_parser)
+
+    async def get_BS4_and_return_URL(self, domain: str, url: URL) -> tuple[BeautifulSoup, URL]:
         """Returns a BeautifulSoup object and response URL from the given URL"""
-        async with client_session.get(url, headers=self._headers, ssl=self.client_manager.ssl_context,
-                                      proxy=self.client_manager.proxy) as response:
-            await self.client_manager.check_http_status(response)
-            content_type = response.headers.get('Content-Type')
-            assert content_type is not None
-            if not any(s in content_type.lower() for s in ("html", "text")):
-                raise InvalidContentTypeFailure(message=f"Received {content_type}, was expecting text")
-            text = await response.text()
-            return BeautifulSoup(text, 'html.parser'), URL(response.url)
+        text, response_url = await self._get(domain, url, content_types=TEXT_CONTENT_TYPES)
+        return BeautifulSoup(text, self.client_manager.html_parser), response_url
 
-    @limiter
-    async def get_json(self, domain: str, url: URL, params: Optional[Dict] = None, headers_inc: Optional[Dict] = None, client_session: ClientSession = None) -> Dict:
+    async def get_BS4_and_extract(self, domain: str, url: URL, extractor: Callable[[BeautifulSoup], T]) -> T:
+        """Returns the data extracted from the page at the given URL
+
+        The extractor must be picklable and return plain data, the page is parsed and the extractor run in the
+        HTML parser worker pool when it's enabled so large pages don't stall the event loop"""
+        text, _ = await self._get(domain, url, content_types=TEXT_CONTENT_TYPES, use_flaresolverr=True)
+        return await self.client_manager.run_html_parser(parse_and_extract, text, extractor, self.client_manager.html_parser)
+
+    async def get_json(self, domain: str, url: URL, params: Optional[Dict] = None, headers_inc: Optional[Dict] = None) -> Dict:
         """Returns a JSON object from the given URL"""
         headers = {**self._headers, **headers_inc} if headers_inc else self._headers
+        text, _ = await self._get(domain, url, headers=headers, params=params, content_types=JSON_CONTENT_TYPES)
+        return json.loads(text)
 
-        async with client_session.get(url, headers=headers, ssl=self.client_manager.ssl_context,
-                                      proxy=self.client_manager.proxy, params=params) as response:
-            await self.client_manager.check_http_status(response)
-            content_type = response.headers.get('Content-Type')
-            assert content_type is not None
-            if 'json' not in content_type.lower():
-                raise InvalidContentTypeFailure(message=f"Received {content_type}, was expecting JSON")
-            return await response.json()
-
-    @limiter
-    async def get_text(self, domain: str, url: URL, client_session: ClientSession) -> str:
+    async def get_text(self, domain: str, url: URL) -> str:
         """Returns a text object from the given URL"""
-        async with client_session.get(url, headers=self._headers, ssl=self.client_manager.ssl_context,
-                                      proxy=self.client_manager.proxy) as response:
-            try:
-                await self.client_manager.check_http_status(response)
-            except DDOSGuardFailure:
-                response_text = await self.flaresolverr(domain, url)
-                return response_text
-            text = await response.text()
-            return text
+        text, _ = await self._get(domain, url, use_flaresolverr=True)
+        return text
 
     @limiter
     async def post_data(self, domain: str, url: URL, client_session: ClientSession, data: Dict, req_resp: bool = True) -> Dict:
         """Returns a JSON object from the given URL when posting data"""
+        # Posting can change what the site serves us (logins), so memoized pages may be stale
+        self._memo.clear()
         async with client_session.post(url, headers=self._headers, ssl=self.client_manager.ssl_context,
                                        proxy=self.client_manager.proxy, data=data) as response:
-            await self.client_manager.check_http_status(response)
+            await self.client_manager.check_http_status(response, domain=domain)
             if req_resp:
                 return json.loads(await response.content.read())
             else:
                 return {}
 
     @limiter
-    async def get_head(self, domain: str, url: URL, client_session: ClientSession) -> CIMultiDictProxy[str]:
+    async def open_connection(self, domain: str, origin: URL, client_session: ClientSession) -> None:
+        """Makes a HEAD request to an origin so a warm connection to it is left in the pool, errors are ignored"""
+        try:
+            async with client_session.head(origin, headers=self._headers, ssl=self.client_manager.ssl_context,
+                                           proxy=self.client_manager.proxy, allow_redirects=False,
+                                           timeout=aiohttp.ClientTimeout(total=self.client_manager.connection_timeout)) as response:
+                await self.client_manager.check_http_status(response, domain=domain)
+        except (ScrapeFailure, DDOSGuardFailure, DownloadFailure, aiohttp.ClientError, asyncio.TimeoutError, OSError, ValueError):
+            pass
+
+    @limiter
+    async def get_head(self, domain: str, url: URL, client_session: ClientSession, headers_inc: Optional[Dict] = None,
+                       allow_redirects: bool = False, raise_for_status: bool = False) -> CIMultiDictProxy[str]:
         """Returns the headers from the given URL"""
-        async with client_session.head(url, headers=self._headers, ssl=self.client_manager.ssl_context,
-                                       proxy=self.client_manager.proxy) as response:
+        headers = {**self._headers, **headers_inc} if headers_inc else self._headers
+        async with client_session.head(url, headers=headers, ssl=self.client_manager.ssl_context,
+                                       proxy=self.client_manager.proxy, allow_redirects=allow_redirects) as response:
+            if raise_for_status:
+                response.raise_for_status()
             return response.headers
@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import asyncio
+import time
+
+from cyberdrop_dl.utils.utilities import log_debug
+
+
+class ResizableSemaphore(asyncio.Semaphore):
+    """Semaphore whose number of slots can be changed while it's in use"""
+    def __init__(self, value: int):
+        super().__init__(value)
+        self.limit = value
+        self._retiring = 0
+
+    def resize(self, limit: int) -> None:
+        """Changes the number of slots, busy slots removed when shrinking are retired as they're released"""
+        while self.limit < limit:
+            self.limit += 1
+            if self._retiring:
+                self._retiring -= 1
+            else:
+                super().release()
+        while self.limit > limit:
+            self.limit -= 1
+            if self._value > 0:
+                self._value -= 1
+            else:
+                self._retiring += 1
+
+    def try_acquire(self) -> bool:
+        """Takes a slot if one is free, without waiting"""
+        if self.locked():
+            return False
+        self._value -= 1
+        return True
+
+    def release(self) -> None:
+        if self._retiring:
+            self._retiring -= 1
+            return
+        super().release()
+
+
+class ConcurrencyTuner:
+    """Finds the number of simultaneous downloads that gets the most throughput out of a domain
+
+    Every `window` seconds the throughput is compared with the previous window. A slot is added while every slot is
+    busy, the last addition is undone when throughput plateaus, and a slot is removed when errors rise. It starts at
+    the configured limit, which is also the ceiling"""
+    window = 5
+    min_gain = 0.05
+    hold_windows = 6
+
+    def __init__(self, domain: str, ceiling: int):
+        self.domain = domain
+        self.ceiling = max(ceiling, 1)
+        self.semaphore = ResizableSemaphore(self.ceiling)
+
+        self.best_throughput = 0.0
+        self._bytes = 0
+        self._errors = 0
+        self._window_start = time.monotonic()
+        self._previous_throughput = 0.0
+        self._previous_errors = 0
+        self._grew = False
+        self._hold = 0
+
+    async def record_bytes(self, size: int) -> None:
+        """Counts bytes written by a download"""
+        self._bytes += size
+        await self.tune()
+
+    async def record_error(self) -> None:
+        """Counts a failed download attempt"""
+        self._errors += 1
+        await self.tune()
+
+    async def tune(self) -> None:
+        """Resizes the semaphore once a measurement window has elapsed"""
+        now = time.monotonic()
+        elapsed = now - self._window_start
+        if elapsed < self.window:
+            return
+        throughput, errors = self._bytes / elapsed, self._errors
+        self._bytes = self._errors = 0
+        self._window_start = now
+        self.best_throughput = max(self.best_throughput, throughput)
+
+        limit = self.semaphore.limit
+        if errors > self._previous_errors or (self._grew and throughput < self._previous_throughput * (1 + self.min_gain)):
+            limit -= 1
+            self._hold = self.hold_windows
+        elif self._hold:
+            self._hold -= 1
+        elif self.semaphore.locked():
+            limit += 1
+        limit = min(max(limit, 1), self.ceiling)
+
+        self._grew = limit > self.semaphore.limit
+        if limit != self.semaphore.limit:
+            await log_debug(f"Download concurrency for {self.domain}: {self.semaphore.limit} -> {limit} "
+                            f"({throughput / 1024 ** 2:.2f} MB/s, {errors} errors)", 10)
+            self.semaphore.resize(limit)
+        self._previous_throughput, self._previous_errors = throughput, errors
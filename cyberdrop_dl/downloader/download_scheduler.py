@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import math
+from typing import TYPE_CHECKING, Dict, Hashable, List, Tuple
+
+if TYPE_CHECKING:
+    from cyberdrop_dl.downloader.concurrency_tuner import ResizableSemaphore
+    from cyberdrop_dl.utils.dataclasses.url_objects import MediaItem
+
+DOWNLOAD_PRIORITY_POLICIES = ("fifo", "smallest_first", "round_robin")
+
+
+class DownloadScheduler:
+    """Hands out the global download slots to queued media items in the order of a priority policy
+
+    fifo: in the order they were queued
+    smallest_first: smallest known size first, items without a known size after those that have one
+    round_robin: alternating between albums, so one large album can't hold every slot
+
+    A media item is only started when its domain also has a free slot, items of busy domains don't block the others"""
+    def __init__(self, max_downloads: int, policy: str):
+        self.policy = policy if policy in DOWNLOAD_PRIORITY_POLICIES else "fifo"
+        self.free_slots = max_downloads
+        self._queues: Dict[str, List[Tuple]] = {}
+        self._semaphores: Dict[str, ResizableSemaphore] = {}
+        self._counter = itertools.count()
+        self._album_counters: Dict[Hashable, itertools.count] = {}
+
+    @property
+    def queued(self) -> int:
+        """Number of media items waiting for a slot"""
+        return sum(len(queue) for queue in self._queues.values())
+
+    async def get_priority(self, media_item: MediaItem) -> Tuple:
+        """Returns the sort key of a media item under the current policy, lower goes first"""
+        order = next(self._counter)
+        if self.policy == "smallest_first":
+            size = media_item.known_size if media_item.known_size is not None else math.inf
+            if isinstance(media_item.filesize, int):
+                size = media_item.filesize
+            return size, order
+        if self.policy == "round_robin":
+            album = media_item.album_id or media_item.download_folder
+            if album not in self._album_counters:
+                self._album_counters[album] = itertools.count()
+            return next(self._album_counters[album]), order
+        return order,
+
+    async def acquire(self, domain: str, semaphore: ResizableSemaphore, media_item: MediaItem) -> None:
+        """Waits until the media item is given a global slot and a slot of its domain"""
+        future = asyncio.get_running_loop().create_future()
+        self._semaphores[domain] = semaphore
+        heapq.heappush(self._queues.setdefault(domain, []), (await self.get_priority(media_item), future))
+        self.dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release(domain)
+            raise
+
+    def release(self, domain: str) -> None:
+        """Gives back the slots of a finished download and starts the next media items"""
+        self._semaphores[domain].release()
+        self.free_slots += 1
+        self.dispatch()
+
+    def dispatch(self) -> None:
+        """Starts the highest priority media items whose domains have a free slot"""
+        while self.free_slots > 0:
+            candidates = [(queue[0], domain) for domain, queue in self._queues.items()
+                          if queue and not self._semaphores[domain].locked()]
+            if not candidates:
+                return
+            (_, future), domain = min(candidates, key=lambda candidate: candidate[0][0])
+            heapq.heappop(self._queues[domain])
+            if future.cancelled():
+                continue
+            self._semaphores[domain].try_acquire()
+            self.free_slots -= 1
+            future.set_result(None)
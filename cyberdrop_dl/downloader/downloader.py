@@ -1,7 +1,9 @@
 from __future__ import annotations
 
 import asyncio
-import os
+import heapq
+import itertools
+import time
 import traceback
 from dataclasses import field, Field
 from functools import wraps
@@ -10,17 +12,21 @@ from pathlib import Path
 from typing import TYPE_CHECKING
 
 import aiohttp
-import filedate
 
 from cyberdrop_dl.clients.download_client import is_4xx_client_error
-from cyberdrop_dl.clients.errors import DownloadFailure, InvalidContentTypeFailure, DDOSGuardFailure
-from cyberdrop_dl.utils.utilities import CustomHTTPStatus, log
+from cyberdrop_dl.clients.errors import DownloadFailure, DownloadStalled, InvalidContentTypeFailure, DDOSGuardFailure, SpaceReserved
+from cyberdrop_dl.downloader.concurrency_tuner import ConcurrencyTuner, ResizableSemaphore
+from cyberdrop_dl.utils.utilities import CustomHTTPStatus, FILE_FORMATS, log
 
 if TYPE_CHECKING:
     from cyberdrop_dl.clients.download_client import DownloadClient
     from cyberdrop_dl.managers.manager import Manager
     from cyberdrop_dl.utils.dataclasses.url_objects import MediaItem
 
+RETRY_BACKOFF_BASE = 2
+MAX_RETRY_BACKOFF = 120
+MAX_RETRY_AFTER = 600
+
 
 def retry(f):
     """This function is a wrapper that handles retrying for failed downloads"""
@@ -60,6 +66,12 @@ def retry(f):
                         await log(f"Download Failed: {media_item.url} with status {e.status}", 40)
                 else:
                     await log(f"Download Failed: {media_item.url} with error {e}", 40)
+
+                delay = await self.get_retry_delay(media_item, e)
+                if delay:
+                    await log(f"Download Retry Scheduled: {media_item.url} with attempt {media_item.current_attempt} in {delay:.1f} seconds", 20)
+                    await self.park(media_item, delay)
+                    break
                 await log(f"Download Retrying: {media_item.url} with attempt {media_item.current_attempt}", 20)
             
             except DDOSGuardFailure as e:
@@ -102,52 +114,152 @@ class Downloader:
         self.client: DownloadClient = field(init=False)
 
         self._file_lock = manager.download_manager.file_lock
-        self._semaphore: asyncio.Semaphore = field(init=False)
+        self._semaphore: ResizableSemaphore = field(init=False)
+        self.tuner: ConcurrencyTuner = field(init=False)
 
         self._additional_headers = {}
 
         self.processed_items: list = []
-        self.waiting_items = 0
         self._current_attempt_filesize = {}
 
+        self.parked_items: set = set()
+        self._retry_queue: list = []
+        self._retry_counter = itertools.count()
+        self._retry_scheduler: asyncio.Task = field(init=False)
+
     async def startup(self) -> None:
         """Starts the downloader"""
         self.client = self.manager.client_manager.downloader_session
-        self._semaphore = asyncio.Semaphore(await self.manager.download_manager.get_download_limit(self.domain))
+        self.tuner = await self.manager.download_manager.get_concurrency_tuner(self.domain)
+        self._semaphore = self.tuner.semaphore
 
         self.manager.path_manager.download_dir.mkdir(parents=True, exist_ok=True)
         if self.manager.config_manager.settings_data['Sorting']['sort_downloads']:
             self.manager.path_manager.sorted_dir.mkdir(parents=True, exist_ok=True)
 
     async def run(self, media_item: MediaItem) -> None:
-        """Runs the download loop"""
-        self.waiting_items += 1
+        """Queues the media item in the download scheduler and downloads it once it's given a slot"""
         media_item.current_attempt = 0
+        if media_item.url.path in self.processed_items:
+            return
+        self.processed_items.append(media_item.url.path)
+        await self.manager.progress_manager.download_progress.update_total()
 
-        await self._semaphore.acquire()
-        self.waiting_items -= 1
-        if media_item.url.path not in self.processed_items:
-            self.processed_items.append(media_item.url.path)
-            await self.manager.progress_manager.download_progress.update_total()
+        if not await self.preflight(media_item):
+            return
 
+        await self.manager.download_manager.scheduler.acquire(self.domain, self._semaphore, media_item)
+        try:
             await log(f"Download Starting: {media_item.url}", 20)
-            async with self.manager.client_manager.download_session_limit:
-                try:
-                    if isinstance(media_item.file_lock_reference_name, Field):
-                        media_item.file_lock_reference_name = media_item.filename
-                    await self._file_lock.check_lock(media_item.file_lock_reference_name)
-                    
-                    await self.download(media_item)
-                except Exception as e:
-                    await log(f"Download Failed: {media_item.url} with error {e}", 40)
-                    await log(traceback.format_exc(), 40)
-                    await self.manager.progress_manager.download_stats_progress.add_failure("Unknown")
-                    await self.manager.progress_manager.download_progress.add_failed()
-                else:
-                    await log(f"Download Finished: {media_item.url}", 20)
-                finally:
-                    await self._file_lock.release_lock(media_item.file_lock_reference_name)
-        self._semaphore.release()
+            await self.start_download(media_item)
+        finally:
+            self.manager.download_manager.scheduler.release(self.domain)
+
+    async def start_download(self, media_item: MediaItem) -> None:
+        """Downloads the media item, the caller holds its download slot"""
+        try:
+            if isinstance(media_item.file_lock_reference_name, Field):
+                media_item.file_lock_reference_name = media_item.filename
+            await self._file_lock.check_lock(media_item.file_lock_reference_name)
+
+            await self.download(media_item)
+        except Exception as e:
+            await log(f"Download Failed: {media_item.url} with error {e}", 40)
+            await log(traceback.format_exc(), 40)
+            await self.manager.progress_manager.download_stats_progress.add_failure("Unknown")
+            await self.manager.progress_manager.download_progress.add_failed()
+        else:
+            if media_item.url.path not in self.parked_items:
+                await log(f"Download Finished: {media_item.url}", 20)
+        finally:
+            await self._file_lock.release_lock(media_item.file_lock_reference_name)
+
+    async def preflight(self, media_item: MediaItem) -> bool:
+        """Checks a media item with a HEAD request before it takes a download slot, returns False if it's been handled
+
+        Files outside the size limits are skipped, HTML served instead of media fails, and files already on disk
+        with the same size are marked complete. When the HEAD request fails, the download decides as usual"""
+        if not self.manager.config_manager.settings_data['Download_Options']['preflight_head_requests']:
+            return True
+        if media_item.known_size is not None:
+            return True
+
+        async with self.manager.download_manager.preflight_limit:
+            try:
+                headers = await asyncio.wait_for(
+                    self.manager.client_manager.scraper_session.get_head(self.domain, media_item.url, headers_inc={"Referer": str(media_item.referer)},
+                                                                         allow_redirects=True, raise_for_status=True),
+                    self.manager.download_manager.preflight_timeout)
+            except (aiohttp.ClientError, asyncio.TimeoutError, DDOSGuardFailure, OSError) as e:
+                await log(f"Preflight inconclusive for {media_item.url}: {e!r}", 10)
+                return True
+
+        content_type = headers.get('Content-Type', '')
+        if any(s in content_type.lower() for s in ('html', 'text')) and media_item.ext not in FILE_FORMATS['Text']:
+            await log(f"Download Failed: {media_item.url} received Invalid Content", 40)
+            await self.manager.log_manager.write_download_error_log(media_item.url, "Invalid Content Received")
+            await self.manager.progress_manager.download_stats_progress.add_failure("Invalid Content Type")
+            await self.manager.progress_manager.download_progress.add_failed()
+            return False
+
+        if 'Content-Length' not in headers or headers.get('Content-Encoding'):
+            return True
+        media_item.known_size = int(headers['Content-Length'])
+        if not await self.manager.download_manager.check_filesize_limits(media_item, media_item.known_size):
+            await log(f"Download Skip {media_item.url} due to filesize restrictions", 10)
+            await self.manager.progress_manager.download_progress.add_skipped()
+            return False
+
+        complete_file = await self.client.get_download_dir(media_item) / media_item.filename
+        complete_stat = (await self.manager.download_manager.stat_files(complete_file))[0]
+        if complete_stat and complete_stat.st_size == media_item.known_size:
+            media_item.complete_file = complete_file
+            media_item.download_filename = complete_file.name
+            media_item.filesize = media_item.known_size
+            await log(f"Skipping {media_item.url} as it has already been downloaded", 10)
+            await self.manager.progress_manager.download_progress.add_previously_completed(False)
+            await self.client.mark_incomplete(media_item, self.domain)
+            await self.client.mark_completed(media_item, self.domain)
+            return False
+        return True
+
+    """~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~"""
+
+    async def get_retry_delay(self, media_item: MediaItem, e: DownloadFailure) -> float:
+        """Returns how long to wait before retrying, honoring the server's Retry-After header"""
+        if getattr(e, "retry_after", None) is not None:
+            return min(e.retry_after, MAX_RETRY_AFTER)
+        if e.status == 999:
+            return 0
+        return min(RETRY_BACKOFF_BASE * 2 ** max(media_item.current_attempt - 1, 0), MAX_RETRY_BACKOFF)
+
+    async def park(self, media_item: MediaItem, delay: float) -> None:
+        """Parks a failed media item outside of its download slot until its backoff has elapsed"""
+        self.parked_items.add(media_item.url.path)
+        heapq.heappush(self._retry_queue, (time.monotonic() + delay, next(self._retry_counter), media_item))
+        if isinstance(self._retry_scheduler, Field) or self._retry_scheduler.done():
+            self._retry_scheduler = self.manager.task_group.create_task(self.retry_scheduler())
+
+    async def retry_scheduler(self) -> None:
+        """Re-admits parked media items once their backoff has elapsed"""
+        while self._retry_queue:
+            retry_at, _, media_item = self._retry_queue[0]
+            delay = retry_at - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(min(delay, 1))
+                continue
+            heapq.heappop(self._retry_queue)
+            self.manager.task_group.create_task(self.readmit(media_item))
+
+    async def readmit(self, media_item: MediaItem) -> None:
+        """Retries a parked media item once the scheduler gives it a download slot again"""
+        await self.manager.download_manager.scheduler.acquire(self.domain, self._semaphore, media_item)
+        self.parked_items.discard(media_item.url.path)
+        try:
+            await log(f"Download Retrying: {media_item.url} with attempt {media_item.current_attempt}", 20)
+            await self.start_download(media_item)
+        finally:
+            self.manager.download_manager.scheduler.release(self.domain)
 
     """~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~"""
 
@@ -161,18 +273,6 @@ class Downloader:
             return False
         return True
 
-    async def set_file_datetime(self, media_item: MediaItem, complete_file: Path) -> None:
-        """Sets the file's datetime"""
-        if self.manager.config_manager.settings_data['Download_Options']['disable_file_timestamps']:
-            return
-        if not isinstance(media_item.datetime, Field):
-            file = filedate.File(str(complete_file))
-            file.set(
-                created=media_item.datetime,
-                modified=media_item.datetime,
-                accessed=media_item.datetime,
-            )
-            
     async def attempt_task_removal(self, media_item: MediaItem) -> None:
         """Attempts to remove the task from the progress bar"""
         if not isinstance(media_item.task_id, Field):
@@ -195,20 +295,20 @@ class Downloader:
             if not isinstance(media_item.current_attempt, int):
                 media_item.current_attempt = 1
 
-            if not await self.check_file_can_download(media_item):
-                await self.manager.progress_manager.download_progress.add_skipped()
-                return
-
             downloaded = await self.client.download_file(self.manager, self.domain, media_item)
             
             if downloaded:
-                os.chmod(media_item.complete_file, 0o666)
-                await self.set_file_datetime(media_item, media_item.complete_file)
                 await self.attempt_task_removal(media_item)
                 await self.manager.progress_manager.download_progress.add_completed()
 
+        except SpaceReserved:
+            # Running downloads release their reservations as they finish, it's retried without using an attempt
+            await self.attempt_task_removal(media_item)
+            await log(f"Download Waiting: {media_item.url} until running downloads free up space", 20)
+            await self.park(media_item, self.manager.download_manager.free_space_interval)
+
         except (aiohttp.ClientPayloadError, aiohttp.ClientOSError, aiohttp.ClientResponseError, ConnectionResetError,
-                DownloadFailure, FileNotFoundError, PermissionError, aiohttp.ServerDisconnectedError, 
+                DownloadFailure, DownloadStalled, FileNotFoundError, PermissionError, aiohttp.ServerDisconnectedError,
                 asyncio.TimeoutError, aiohttp.ServerTimeoutError) as e:
             if hasattr(e, "status"):
                 if ((await is_4xx_client_error(e.status) and e.status != HTTPStatus.TOO_MANY_REQUESTS)
@@ -228,12 +328,17 @@ class Downloader:
                         await self.manager.log_manager.write_download_error_log(media_item.url, f" {e.status}")
                     return
 
-            if isinstance(media_item.partial_file, Path) and media_item.partial_file.is_file():
-                size = media_item.partial_file.stat().st_size
+            # Failures on local resources (disk space, files, a slow disk stalling the stream) say nothing about the
+            # domain, only the others count against its download concurrency
+            if not isinstance(e, (DownloadStalled, FileNotFoundError, PermissionError)) and getattr(e, "status", None) != "No Free Space":
+                await self.tuner.record_error()
+
+            if isinstance(media_item.partial_file, Path) and (await self.manager.download_manager.stat_files(media_item.partial_file))[0]:
+                size = await self.client.get_downloaded_size(media_item)
                 if media_item.filename in self._current_attempt_filesize and self._current_attempt_filesize[media_item.filename] >= size:
-                    raise DownloadFailure(status=getattr(e, "status", type(e).__name__), message="Download failed")
+                    raise DownloadFailure(status=getattr(e, "status", type(e).__name__), message="Download failed", retry_after=getattr(e, "retry_after", None))
                 self._current_attempt_filesize[media_item.filename] = size
                 media_item.current_attempt = 0
-                raise DownloadFailure(status=999, message="Download timeout reached, retrying")
+                raise DownloadFailure(status=999, message="Download timeout reached, retrying", retry_after=getattr(e, "retry_after", None))
 
-            raise DownloadFailure(status=getattr(e, "status", type(e).__name__), message=repr(e))
+            raise DownloadFailure(status=getattr(e, "status", type(e).__name__), message=repr(e), retry_after=getattr(e, "retry_after", None))
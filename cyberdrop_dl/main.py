@@ -111,6 +111,7 @@ async def director(manager: Manager) -> None:
                         await runtime(manager)
                 else:
                     await runtime(manager)
+                await manager.db_manager.flush()
             except Exception as e:
                 print("\nAn error occurred, please report this to the developer")
                 print(e)
@@ -136,6 +137,7 @@ async def director(manager: Manager) -> None:
             
         await log("Printing Stats...", 20)
         await manager.progress_manager.print_stats()
+        await manager.client_manager.request_stats.write_json(manager.path_manager.request_stats_log)
 
         await log("Checking for Program End...", 20)
         if not manager.args_manager.all_configs or not list(set(configs) - set(configs_ran)):
@@ -1,24 +1,52 @@
 from __future__ import annotations
 
 import asyncio
+import importlib.util
+import multiprocessing
 import ssl
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 from http import HTTPStatus
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, Optional, Tuple
 
 import aiohttp
 import certifi
-from aiohttp import ClientResponse, ContentTypeError
+from aiohttp import ClientResponse, ContentTypeError, TCPConnector
 from aiolimiter import AsyncLimiter
 
+from cyberdrop_dl.clients.dns_resolver import CachingResolver
 from cyberdrop_dl.clients.download_client import DownloadClient
 from cyberdrop_dl.clients.errors import DownloadFailure, DDOSGuardFailure, ScrapeFailure
+from cyberdrop_dl.clients.rate_limiter import AdaptiveLimiter
+from cyberdrop_dl.clients.request_stats import RequestStats
+from cyberdrop_dl.clients.response_cache import ResponseCache
 from cyberdrop_dl.clients.scraper_client import ScraperClient
-from cyberdrop_dl.utils.utilities import CustomHTTPStatus
+from cyberdrop_dl.utils.utilities import CustomHTTPStatus, log, log_debug
 
 if TYPE_CHECKING:
+    from multidict import CIMultiDictProxy
+    from yarl import URL
+
     from cyberdrop_dl.managers.manager import Manager
 
 
+async def get_retry_after(headers: CIMultiDictProxy[str]) -> Optional[float]:
+    """Returns the number of seconds the server asked us to wait with the Retry-After header"""
+    retry_after = headers.get('Retry-After')
+    if not retry_after:
+        return None
+    if retry_after.strip().isdigit():
+        return float(retry_after)
+    try:
+        retry_at = parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0)
+
+
 class ClientManager:
     """Creates a 'client' that can be referenced by scraping or download sessions"""
     def __init__(self, manager: Manager):
@@ -31,30 +59,108 @@ class ClientManager:
         self.user_agent = manager.config_manager.global_settings_data['General']['user_agent']
         self.verify_ssl = not manager.config_manager.global_settings_data['General']['allow_insecure_connections']
         self.simultaneous_per_domain = manager.config_manager.global_settings_data['Rate_Limiting_Options']['max_simultaneous_downloads_per_domain']
+        self.connection_limit = manager.config_manager.global_settings_data['Rate_Limiting_Options']['connection_limit']
+        self.connection_limit_per_host = manager.config_manager.global_settings_data['Rate_Limiting_Options']['connection_limit_per_host']
+        self.keepalive_timeout = manager.config_manager.global_settings_data['Rate_Limiting_Options']['keepalive_timeout']
+        self.dns_cache_ttl = manager.config_manager.global_settings_data['Rate_Limiting_Options']['dns_cache_ttl']
+        self.max_segments = manager.config_manager.global_settings_data['Rate_Limiting_Options']['max_segments_per_download']
+        self.segment_threshold = manager.config_manager.global_settings_data['Rate_Limiting_Options']['segmented_download_threshold'] * 1024 ** 2
+        self.read_chunk_size = max(manager.config_manager.global_settings_data['Rate_Limiting_Options']['read_chunk_size'], 1) * 1024
+        self.write_buffer_size = max(manager.config_manager.global_settings_data['Rate_Limiting_Options']['write_buffer_size'], 1) * 1024 ** 2
+        self.stall_speed_floor = manager.config_manager.global_settings_data['Rate_Limiting_Options']['stall_speed_floor'] * 1024
+        self.stall_window = max(manager.config_manager.global_settings_data['Rate_Limiting_Options']['stall_window'], 1)
+        self.html_parser_workers = manager.config_manager.global_settings_data['General']['html_parser_workers']
+        self.html_parser = manager.config_manager.global_settings_data['General']['html_parser']
+        self.preallocate_files = manager.config_manager.global_settings_data['General']['preallocate_files']
 
         self.ssl_context = ssl.create_default_context(cafile=certifi.where()) if self.verify_ssl else False
         self.cookies = aiohttp.CookieJar(quote_cookie=False)
         self.proxy = manager.config_manager.global_settings_data['General']['proxy'] if not manager.args_manager.proxy else manager.args_manager.proxy
         self.flaresolverr = manager.config_manager.global_settings_data['General']['flaresolverr'] if not manager.args_manager.flaresolverr else manager.args_manager.flaresolverr
 
-        self.domain_rate_limits = {
-            "bunkrr": AsyncLimiter(5, 1),
-            "cyberdrop": AsyncLimiter(5, 1),
-            "coomer": AsyncLimiter(1, 1),
-            "kemono": AsyncLimiter(1, 1),
-            "pixeldrain": AsyncLimiter(10, 1),
-            "other": AsyncLimiter(25, 1)
-        }
+        self.default_rate_limits = {"bunkrr": 5, "cyberdrop": 5, "coomer": 1, "kemono": 1, "pixeldrain": 10, "other": 25}
+        # A domain's rate can grow to this multiple of its default rate, and never above the global rate limit
+        self.domain_rate_headroom = 4
+        self.learned_rate_limits: Dict[str, float] = manager.cache_manager.get("learned_rate_limits") or {}
+        self.domain_rate_limits: Dict[str, AdaptiveLimiter] = {}
         
         self.download_spacer = {'bunkr': 0.5, 'bunkrr': 0.5, 'cyberdrop': 0, 'cyberfile': 0, "pixeldrain": 0, "coomer": 0.5, "kemono": 0.5}
 
         self.global_rate_limiter = AsyncLimiter(self.rate_limit, 1)
         self.session_limit = asyncio.Semaphore(50)
-        self.download_session_limit = asyncio.Semaphore(self.manager.config_manager.global_settings_data['Rate_Limiting_Options']['max_simultaneous_downloads'])
+
+        self.resolver: CachingResolver | None = None
+        self.connector: TCPConnector | None = None
+        self.connections_created = 0
+        self.connections_reused = 0
+        self.html_parser_pool: ProcessPoolExecutor | None = None
+        self.request_stats = RequestStats()
+
+        self.response_cache = ResponseCache(manager.path_manager.cache_dir / "response_cache.db",
+                                            manager.config_manager.global_settings_data['General']['scrape_cache_size'] * 1024 ** 2)
 
         self.scraper_session = ScraperClient(self)
         self.downloader_session = DownloadClient(manager, self)
 
+    async def startup(self) -> None:
+        """Opens the shared connection pool and the long-lived client sessions"""
+        if self.connector and not self.connector.closed:
+            return
+        self.resolver = CachingResolver(self.dns_cache_ttl)
+        self.connector = TCPConnector(limit=self.connection_limit, limit_per_host=self.connection_limit_per_host,
+                                      keepalive_timeout=self.keepalive_timeout, ssl=self.ssl_context,
+                                      resolver=self.resolver, use_dns_cache=False)
+        if self.html_parser != "html.parser" and not importlib.util.find_spec(self.html_parser):
+            await log(f"HTML parser {self.html_parser} is not installed, falling back to html.parser", 30)
+            self.html_parser = "html.parser"
+        if self.html_parser_workers > 0:
+            self.html_parser_pool = ProcessPoolExecutor(max_workers=self.html_parser_workers,
+                                                        mp_context=multiprocessing.get_context("spawn"))
+        await self.response_cache.startup()
+        await self.scraper_session.startup()
+        await self.downloader_session.startup()
+
+    async def close(self) -> None:
+        """Closes the client sessions and the shared connection pool"""
+        await self.scraper_session.close()
+        await self.downloader_session.close()
+        if self.connector and not self.connector.closed:
+            await self.connector.close()
+        if self.resolver:
+            await self.resolver.close()
+            await log(f"DNS lookups: {self.resolver.misses} resolved, {self.resolver.hits} served from cache", 10)
+            self.resolver = None
+        await self.response_cache.close()
+        if self.html_parser_pool:
+            self.html_parser_pool.shutdown(cancel_futures=True)
+            self.html_parser_pool = None
+        await log(f"Connections created: {self.connections_created}, connections reused: {self.connections_reused}", 10)
+        await self.save_rate_limits()
+
+    def get_connection_trace_config(self) -> aiohttp.TraceConfig:
+        """Returns a trace config that counts new and reused pooled connections"""
+        async def on_connection_create_end(session, trace_config_ctx, params):
+            self.connections_created += 1
+
+        async def on_connection_reuseconn(session, trace_config_ctx, params):
+            self.connections_reused += 1
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+        return trace_config
+
+    async def prewarm(self, urls: Iterable[Tuple[str, URL]]) -> None:
+        """Resolves and opens pooled connections to the distinct hosts of the input (domain, URL) pairs, ahead of their first request"""
+        origins = {(domain, url.origin()) for domain, url in urls if url.host and url.scheme in ("http", "https")}
+        await asyncio.gather(*(self.scraper_session.open_connection(domain, origin) for domain, origin in origins))
+
+    async def run_html_parser(self, func: Callable[..., Any], *args) -> Any:
+        """Runs a parsing function in the HTML parser worker pool, or on the event loop when the pool is disabled"""
+        if not self.html_parser_pool:
+            return func(*args)
+        return await asyncio.get_running_loop().run_in_executor(self.html_parser_pool, func, *args)
+
     """~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~"""
 
     async def get_downloader_spacer(self, key: str) -> float:
@@ -63,15 +169,34 @@ class ClientManager:
             return self.download_spacer[key]
         return 0.1
 
-    async def get_rate_limiter(self, domain: str) -> AsyncLimiter:
-        """Get a rate limiter for a domain"""
-        if domain in self.domain_rate_limits:
-            return self.domain_rate_limits[domain]
-        return self.domain_rate_limits["other"]
+    async def get_rate_limiter(self, domain: str) -> AdaptiveLimiter:
+        """Get a rate limiter for a domain, starting from the last rate learned for it
+
+        Domains without a default rate of their own share the "other" limiter"""
+        key = domain if domain in self.default_rate_limits else "other"
+        if key not in self.domain_rate_limits:
+            default_rate = self.default_rate_limits[key]
+            rate = self.learned_rate_limits.get(key, default_rate)
+            ceiling = min(self.rate_limit, default_rate * self.domain_rate_headroom)
+            self.domain_rate_limits[key] = AdaptiveLimiter(rate, ceiling=ceiling)
+        return self.domain_rate_limits[key]
+
+    async def throttle_domain(self, domain: str, reason: str) -> None:
+        """Cuts the rate limit for a domain after the server signals it is overloaded"""
+        domain_limiter = await self.get_rate_limiter(domain)
+        if await domain_limiter.on_throttle():
+            await log_debug(f"Rate limit for {domain} lowered to {domain_limiter.rate:.2f}/s ({reason})", 10)
+
+    async def save_rate_limits(self) -> None:
+        """Persists the learned rate limits so the next run starts from them"""
+        for domain, domain_limiter in self.domain_rate_limits.items():
+            self.learned_rate_limits[domain] = round(domain_limiter.rate, 2)
+        if self.learned_rate_limits:
+            self.manager.cache_manager.save("learned_rate_limits", self.learned_rate_limits)
 
     """~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~"""
 
-    async def check_http_status(self, response: ClientResponse, download: bool = False) -> None:
+    async def check_http_status(self, response: ClientResponse, download: bool = False, domain: str = None) -> None:
         """Checks the HTTP status code and raises an exception if it's not acceptable"""
         status = response.status
         headers = response.headers
@@ -85,8 +210,13 @@ class ClientManager:
                 raise DownloadFailure(status=HTTPStatus.NOT_FOUND, message="SC Scrape Image")
 
         if HTTPStatus.OK <= status < HTTPStatus.BAD_REQUEST:
+            if domain:
+                await (await self.get_rate_limiter(domain)).on_success()
             return
-        
+
+        if domain and status in (HTTPStatus.TOO_MANY_REQUESTS, HTTPStatus.SERVICE_UNAVAILABLE, CustomHTTPStatus.WEB_SERVER_IS_DOWN):
+            await self.throttle_domain(domain, f"HTTP status code {status}")
+
         if "gofile" in response.url.host.lower():
             try:
                 JSON_Resp = await response.json()
@@ -110,9 +240,11 @@ class ClientManager:
 
         response_text = await response.text()
         if "<title>DDoS-Guard</title>" in response_text:
+            if domain:
+                await self.throttle_domain(domain, "DDoS-Guard")
             raise DDOSGuardFailure(status="DDOS-Guard", message="DDoS-Guard detected")
 
         if not headers.get('Content-Type'):
             raise DownloadFailure(status=CustomHTTPStatus.IM_A_TEAPOT, message="No content-type in response header")
 
-        raise DownloadFailure(status=status, message=f"HTTP status code {status}: {phrase}")
+        raise DownloadFailure(status=status, message=f"HTTP status code {status}: {phrase}", retry_after=await get_retry_after(headers))
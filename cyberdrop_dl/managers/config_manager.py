@@ -147,6 +147,10 @@ class ConfigManager:
             self.global_settings_data['General']['max_file_name_length'])
         self.global_settings_data['General']['max_folder_name_length'] = int(
             self.global_settings_data['General']['max_folder_name_length'])
+        self.global_settings_data['General']['scrape_cache_size'] = int(
+            self.global_settings_data['General']['scrape_cache_size'])
+        self.global_settings_data['General']['html_parser_workers'] = int(
+            self.global_settings_data['General']['html_parser_workers'])
 
         self.global_settings_data['Rate_Limiting_Options']['connection_timeout'] = int(
             self.global_settings_data['Rate_Limiting_Options']['connection_timeout'])
@@ -162,6 +166,26 @@ class ConfigManager:
             self.global_settings_data['Rate_Limiting_Options']['rate_limit'])
         self.global_settings_data['Rate_Limiting_Options']['read_timeout'] = int(
             self.global_settings_data['Rate_Limiting_Options']['read_timeout'])
+        self.global_settings_data['Rate_Limiting_Options']['connection_limit'] = int(
+            self.global_settings_data['Rate_Limiting_Options']['connection_limit'])
+        self.global_settings_data['Rate_Limiting_Options']['connection_limit_per_host'] = int(
+            self.global_settings_data['Rate_Limiting_Options']['connection_limit_per_host'])
+        self.global_settings_data['Rate_Limiting_Options']['keepalive_timeout'] = int(
+            self.global_settings_data['Rate_Limiting_Options']['keepalive_timeout'])
+        self.global_settings_data['Rate_Limiting_Options']['dns_cache_ttl'] = int(
+            self.global_settings_data['Rate_Limiting_Options']['dns_cache_ttl'])
+        self.global_settings_data['Rate_Limiting_Options']['max_segments_per_download'] = int(
+            self.global_settings_data['Rate_Limiting_Options']['max_segments_per_download'])
+        self.global_settings_data['Rate_Limiting_Options']['segmented_download_threshold'] = int(
+            self.global_settings_data['Rate_Limiting_Options']['segmented_download_threshold'])
+        self.global_settings_data['Rate_Limiting_Options']['read_chunk_size'] = int(
+            self.global_settings_data['Rate_Limiting_Options']['read_chunk_size'])
+        self.global_settings_data['Rate_Limiting_Options']['write_buffer_size'] = int(
+            self.global_settings_data['Rate_Limiting_Options']['write_buffer_size'])
+        self.global_settings_data['Rate_Limiting_Options']['stall_speed_floor'] = int(
+            self.global_settings_data['Rate_Limiting_Options']['stall_speed_floor'])
+        self.global_settings_data['Rate_Limiting_Options']['stall_window'] = int(
+            self.global_settings_data['Rate_Limiting_Options']['stall_window'])
 
         self.global_settings_data['UI_Options']['refresh_rate'] = int(
             self.global_settings_data['UI_Options']['refresh_rate'])
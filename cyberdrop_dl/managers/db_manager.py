@@ -1,11 +1,14 @@
+import time
 from dataclasses import field
 from pathlib import Path
 from typing import TYPE_CHECKING
 
 import aiosqlite
 
+from cyberdrop_dl.utils.database.db_writer import DBWriter
 from cyberdrop_dl.utils.database.tables.history_table import HistoryTable
 from cyberdrop_dl.utils.database.tables.temp_table import TempTable
+from cyberdrop_dl.utils.utilities import log, log_debug
 
 if TYPE_CHECKING:
     from cyberdrop_dl.managers.manager import Manager
@@ -15,7 +18,9 @@ class DBManager:
     def __init__(self, manager: 'Manager', db_path: Path):
         self.manager = manager
         self._db_conn: aiosqlite.Connection = field(init=False)
+        self._read_conn: aiosqlite.Connection = field(init=False)
         self._db_path: Path = db_path
+        self.writer: DBWriter = field(init=False)
 
         self.ignore_history: bool = False
 
@@ -23,23 +28,53 @@ class DBManager:
         self.temp_table: TempTable = field(init=False)
 
     async def startup(self) -> None:
-        """Startup process for the DBManager"""
+        """Startup process for the DBManager
+
+        The database is journaled with WAL, so lookups on the read connection don't wait behind the writer.
+        Migrations only run once, so starting against an up to date database takes constant time"""
+        started = time.perf_counter()
         self._db_conn = await aiosqlite.connect(self._db_path)
+        await self._db_conn.execute("""PRAGMA journal_mode = WAL""")
+        await self._db_conn.execute("""PRAGMA synchronous = NORMAL""")
+        self.writer = DBWriter(self._db_conn)
 
         self.ignore_history = self.manager.config_manager.settings_data['Runtime_Options']['ignore_history']
 
-        self.history_table = HistoryTable(self._db_conn)
+        self.history_table = HistoryTable(self._db_conn, self.writer)
         self.temp_table = TempTable(self._db_conn)
 
         self.history_table.ignore_history = self.ignore_history
 
-        await self._pre_allocate()
+        # The space is set aside along with the first migration, not topped up on every launch
+        if not await self.history_table.get_version():
+            await self._pre_allocate()
 
         await self.history_table.startup()
         await self.temp_table.startup()
 
+        if self.manager.config_manager.settings_data['Runtime_Options']['history_membership_filter'] and not self.ignore_history:
+            loading_started = time.perf_counter()
+            await self.history_table.load_membership()
+            membership = self.history_table.membership
+            await log(f"History filter: {membership.count} files in {membership.nbytes / 1024 ** 2:.2f} MB, "
+                      f"built in {time.perf_counter() - loading_started:.3f} seconds", 20)
+
+        self._read_conn = await aiosqlite.connect(self._db_path)
+        self.history_table.read_conn = self._read_conn
+        await self.writer.startup()
+        await log(f"History database ready in {time.perf_counter() - started:.3f} seconds (version {await self.history_table.get_version()})", 10)
+
+    async def flush(self) -> None:
+        """Commits the history writes that are still queued"""
+        await self.writer.flush()
+
     async def close(self) -> None:
         """Close the DBManager"""
+        if isinstance(self.history_table, HistoryTable) and self.history_table.membership is not None:
+            await log_debug(f"History lookups skipped by the filter: {self.history_table.membership_skips}", 10)
+        await self.writer.close()
+        if isinstance(self._read_conn, aiosqlite.Connection):
+            await self._read_conn.close()
         await self._db_conn.close()
 
     async def _pre_allocate(self) -> None:
@@ -2,18 +2,54 @@ from __future__ import annotations
 
 import asyncio
 import contextlib
+import os
 import shutil
 from base64 import b64encode
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import field
 from typing import TYPE_CHECKING
 
-from cyberdrop_dl.utils.utilities import FILE_FORMATS, log_debug
+import filedate
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from cyberdrop_dl.downloader.concurrency_tuner import ConcurrencyTuner
+from cyberdrop_dl.downloader.download_scheduler import DownloadScheduler
+from cyberdrop_dl.utils.utilities import FILE_FORMATS, log, log_debug
 
 if TYPE_CHECKING:
-    from typing import Dict
+    from pathlib import Path
+    from typing import Any, Callable, Dict, List, Optional
 
     from cyberdrop_dl.managers.manager import Manager
     from cyberdrop_dl.utils.dataclasses.url_objects import MediaItem
 
+DEDUPE_MODES = ("off", "hardlink", "reflink", "skip")
+
+# ioctl that makes a file share the extents of another (btrfs, xfs), from linux/fs.h
+FICLONE = 0x40049409
+
+
+def link_duplicate(source: Path, dest: Path, mode: str) -> bool:
+    """Replaces dest with a hardlink or reflink of source, returns False and leaves dest alone if the link can't be made"""
+    temp_file = dest.with_name(f"{dest.name}.link")
+    try:
+        if mode == "hardlink":
+            os.link(source, temp_file)
+        else:
+            if fcntl is None:
+                return False
+            with open(source, 'rb') as src, open(temp_file, 'wb') as dst:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        temp_file.replace(dest)
+    except OSError:
+        temp_file.unlink(missing_ok=True)
+        return False
+    return True
+
 
 class FileLock:
     """Is this necessary? No. But I want it."""
@@ -48,6 +84,40 @@ class DownloadManager:
         self.file_lock = FileLock()
 
         self.download_limits = {'bunkr': 1, 'bunkrr': 1, 'cyberdrop': 1, 'cyberfile': 1, "pixeldrain": 2}
+        self.concurrency_tuners: Dict[str, ConcurrencyTuner] = {}
+        self.scheduler = DownloadScheduler(manager.config_manager.global_settings_data['Rate_Limiting_Options']['max_simultaneous_downloads'],
+                                           manager.config_manager.global_settings_data['Rate_Limiting_Options']['download_priority'])
+
+        # Free space is sampled in the background, running downloads reserve the bytes they're about to write from it
+        self.free_space_interval = 5
+        self.free_space = 0
+        self.reserved_space = 0
+        self._reservations: Dict[Path, int] = {}
+        self._free_space_sampler: asyncio.Task = field(init=False)
+
+        # HEAD requests checking files before they take a download slot, limited so they stay cheap
+        self.preflight_limit = asyncio.Semaphore(4)
+        self.preflight_timeout = 10
+
+        # Filesystem calls can block for a while on network drives, so they run in their own bounded pool
+        self.filesystem_workers = 8
+        self._filesystem_pool = ThreadPoolExecutor(max_workers=self.filesystem_workers, thread_name_prefix="filesystem")
+
+    async def startup(self) -> None:
+        """Takes the first free space sample and starts sampling in the background"""
+        await self.sample_free_space()
+        self._free_space_sampler = asyncio.create_task(self.sample_free_space_periodically())
+
+    async def close(self) -> None:
+        """Stops the free space sampler and logs the download concurrency chosen for each domain"""
+        for domain, tuner in sorted(self.concurrency_tuners.items()):
+            await log(f"Download concurrency for {domain}: {tuner.semaphore.limit} of {tuner.ceiling} "
+                      f"(best {tuner.best_throughput / 1024 ** 2:.2f} MB/s)", 20)
+        if isinstance(self._free_space_sampler, asyncio.Task):
+            self._free_space_sampler.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._free_space_sampler
+        self._filesystem_pool.shutdown(wait=False)
 
     async def get_download_limit(self, key: str) -> int:
         """Returns the download limit for a domain"""
@@ -60,16 +130,125 @@ class DownloadManager:
             instances = self.manager.config_manager.global_settings_data['Rate_Limiting_Options']['max_simultaneous_downloads_per_domain']
         return instances
 
+    async def get_concurrency_tuner(self, domain: str) -> ConcurrencyTuner:
+        """Returns the concurrency tuner of a domain, its download limit is the ceiling"""
+        if domain not in self.concurrency_tuners:
+            self.concurrency_tuners[domain] = ConcurrencyTuner(domain, await self.get_download_limit(domain))
+        return self.concurrency_tuners[domain]
+
+    async def record_transfer(self, domain: str, size: int) -> None:
+        """Counts bytes written by a download towards its domain's throughput"""
+        if domain in self.concurrency_tuners:
+            await self.concurrency_tuners[domain].record_bytes(size)
+            # The tuner may have added a slot to the domain
+            self.scheduler.dispatch()
+
     async def basic_auth(self, username, password) -> str:
         """Returns a basic auth token"""
         token = b64encode(f"{username}:{password}".encode('utf-8')).decode("ascii")
         return f'Basic {token}'
 
-    async def check_free_space(self) -> bool:
-        """Checks if there is enough free space on the drive to continue operating"""
-        free_space = shutil.disk_usage(self.manager.path_manager.download_dir.parent).free
-        free_space_gb = free_space / 1024 ** 3
-        return free_space_gb >= self.manager.config_manager.global_settings_data['General']['required_free_space']
+    async def get_required_free_space(self) -> int:
+        """Returns the number of bytes that must be left free on the drive"""
+        return self.manager.config_manager.global_settings_data['General']['required_free_space'] * 1024 ** 3
+
+    async def sample_free_space(self) -> None:
+        """Reads the free space of the download drive"""
+        usage = await self.run_filesystem(shutil.disk_usage, self.manager.path_manager.download_dir.parent)
+        self.free_space = usage.free
+
+    async def sample_free_space_periodically(self) -> None:
+        """Keeps the free space sample up to date"""
+        while True:
+            await asyncio.sleep(self.free_space_interval)
+            with contextlib.suppress(OSError):
+                await self.sample_free_space()
+
+    async def check_free_space(self, size: int = 0) -> bool:
+        """Checks if there is enough free space on the drive to continue operating after writing `size` bytes,
+        regardless of what running downloads have reserved"""
+        return self.free_space - size >= await self.get_required_free_space()
+
+    async def reserve_space(self, partial_file: Path, size: int) -> bool:
+        """Reserves the bytes a download is about to write, returns False if that and the other reservations would leave
+        too little free space"""
+        await self.release_space(partial_file)
+        if self.free_space - self.reserved_space - size < await self.get_required_free_space():
+            return False
+        self._reservations[partial_file] = size
+        self.reserved_space += size
+        return True
+
+    async def consume_space(self, partial_file: Path, size: int) -> None:
+        """Moves written bytes out of a reservation, they're used space until the next sample sees them"""
+        used = min(size, self._reservations.get(partial_file, 0))
+        if not used:
+            return
+        self._reservations[partial_file] -= used
+        self.reserved_space -= used
+        self.free_space -= used
+
+    async def release_space(self, partial_file: Path) -> None:
+        """Returns what's left of a download's reservation"""
+        self.reserved_space -= self._reservations.pop(partial_file, 0)
+
+    """~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~"""
+
+    async def get_dedupe_mode(self) -> str:
+        """Returns what to do with downloads identical to an earlier one"""
+        dedupe_mode = self.manager.config_manager.settings_data['Download_Options']['dedupe_mode']
+        return dedupe_mode if dedupe_mode in DEDUPE_MODES else "off"
+
+    async def link_duplicate(self, source: Path, dest: Path) -> bool:
+        """Makes dest a link to an earlier download per the dedupe mode, returns False if no file was created"""
+        dedupe_mode = await self.get_dedupe_mode()
+        if dedupe_mode not in ("hardlink", "reflink"):
+            return False
+        return await self.run_filesystem(link_duplicate, source, dest, dedupe_mode)
+
+    async def run_filesystem(self, func: Callable[..., Any], *args) -> Any:
+        """Runs a blocking filesystem call in the filesystem thread pool"""
+        return await asyncio.get_running_loop().run_in_executor(self._filesystem_pool, func, *args)
+
+    async def stat_files(self, *paths: Path) -> List[Optional[os.stat_result]]:
+        """Returns the stat of each path, None for the ones that don't exist, in a single trip to the pool"""
+        def stat_all() -> List[Optional[os.stat_result]]:
+            results = []
+            for path in paths:
+                try:
+                    results.append(path.stat())
+                except FileNotFoundError:
+                    results.append(None)
+            return results
+        return await self.run_filesystem(stat_all)
+
+    async def remove_files(self, *paths: Path) -> None:
+        """Removes each path that exists, in a single trip to the pool"""
+        def remove_all() -> None:
+            for path in paths:
+                path.unlink(missing_ok=True)
+        await self.run_filesystem(remove_all)
+
+    async def finalize_file(self, partial_file: Path, complete_file: Path, file_datetime: Optional[Any] = None,
+                            duplicate_of: Optional[Path] = None) -> None:
+        """Renames a finished part file, makes it writable for everyone and sets its dates, in a single trip to the pool
+
+        When it's a duplicate of an earlier download, it's replaced with a link to it or deleted, per the dedupe mode"""
+        dedupe_mode = await self.get_dedupe_mode()
+
+        def finalize() -> None:
+            if duplicate_of and dedupe_mode == "skip":
+                partial_file.unlink()
+                return
+            linked = bool(duplicate_of) and link_duplicate(duplicate_of, partial_file, dedupe_mode)
+            partial_file.rename(complete_file)
+            if linked and dedupe_mode == "hardlink":
+                # It's the earlier file's inode now, its mode and dates are left as they are
+                return
+            os.chmod(complete_file, 0o666)
+            if file_datetime:
+                filedate.File(str(complete_file)).set(created=file_datetime, modified=file_datetime, accessed=file_datetime)
+        await self.run_filesystem(finalize)
 
     async def check_allowed_filetype(self, media_item: MediaItem) -> bool:
         """Checks if the file type is allowed to download"""
@@ -84,3 +263,38 @@ class DownloadManager:
               media_item.ext not in FILE_FORMATS['Audio']):
             return False
         return True
+
+    async def check_filesize_limits(self, media: MediaItem, size: int) -> bool:
+        """Checks if the file size is within the limits for the media item's type"""
+        max_video_filesize = self.manager.config_manager.settings_data['File_Size_Limits']['maximum_video_size']
+        min_video_filesize = self.manager.config_manager.settings_data['File_Size_Limits']['minimum_video_size']
+        max_image_filesize = self.manager.config_manager.settings_data['File_Size_Limits']['maximum_image_size']
+        min_image_filesize = self.manager.config_manager.settings_data['File_Size_Limits']['minimum_image_size']
+        max_other_filesize = self.manager.config_manager.settings_data['File_Size_Limits']['maximum_other_size']
+        min_other_filesize = self.manager.config_manager.settings_data['File_Size_Limits']['minimum_other_size']
+
+        if media.ext in FILE_FORMATS['Images']:
+            if max_image_filesize and min_image_filesize:
+                if size < min_image_filesize or size > max_image_filesize:
+                    return False
+            if size < min_image_filesize:
+                return False
+            if max_image_filesize and size > max_image_filesize:
+                return False
+        elif media.ext in FILE_FORMATS['Videos']:
+            if max_video_filesize and min_video_filesize:
+                if size < min_video_filesize or size > max_video_filesize:
+                    return False
+            if size < min_video_filesize:
+                return False
+            if max_video_filesize and size > max_video_filesize:
+                return False
+        else:
+            if max_other_filesize and min_other_filesize:
+                if size < min_other_filesize or size > max_other_filesize:
+                    return False
+            if size < min_other_filesize:
+                return False
+            if max_other_filesize and size > max_other_filesize:
+                return False
+        return True
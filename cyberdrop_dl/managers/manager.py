@@ -78,8 +78,10 @@ class Manager:
             await self.db_manager.startup()
         if not isinstance(self.client_manager, ClientManager):
             self.client_manager = ClientManager(self)
+        await self.client_manager.startup()
         if not isinstance(self.download_manager, DownloadManager):
             self.download_manager = DownloadManager(self)
+            await self.download_manager.startup()
         self.progress_manager = ProgressManager(self)
         await self.progress_manager.startup()
 
@@ -167,4 +169,9 @@ class Manager:
 
     async def close(self) -> None:
         """Closes the manager"""
+        # The history is closed first, so queued writes are committed even if the sessions fail to close on an interrupt
         await self.db_manager.close()
+        if isinstance(self.client_manager, ClientManager):
+            await self.client_manager.close()
+        if isinstance(self.download_manager, DownloadManager):
+            await self.download_manager.close()
@@ -34,6 +34,7 @@ class PathManager:
         self.unsupported_urls_log: Path = field(init=False)
         self.download_error_log: Path = field(init=False)
         self.scrape_error_log: Path = field(init=False)
+        self.request_stats_log: Path = field(init=False)
 
     def pre_startup(self) -> None:
         if self.manager.args_manager.appdata_dir:
@@ -64,6 +65,7 @@ class PathManager:
                                                   if not self.manager.args_manager.download_error_urls_filename else self.manager.args_manager.download_error_urls_filename)
         self.scrape_error_log = self.log_dir / (self.manager.config_manager.settings_data['Logs']['scrape_error_urls_filename']
                                                 if not self.manager.args_manager.scrape_error_urls_filename else self.manager.args_manager.scrape_error_urls_filename)
+        self.request_stats_log = self.log_dir / "request_stats.json"
 
         self.log_dir.mkdir(parents=True, exist_ok=True)
         if not self.input_file.is_file():
@@ -63,4 +63,11 @@ class ProgressManager:
         download_failures = await self.download_stats_progress.return_totals()
         await log_with_color("\nDownload Failures:", "cyan", 20)
         for key, value in download_failures.items():
-            await log_with_color(f"Download Failures ({key}): {value}", "red", 20)
\ No newline at end of file
+            await log_with_color(f"Download Failures ({key}): {value}", "red", 20)
+
+        slowest_hosts = self.manager.client_manager.request_stats.get_slowest_hosts()
+        await log_with_color("\nSlowest Hosts:", "cyan", 20)
+        for host, host_stats in slowest_hosts:
+            await log_with_color(f"{host}: {host_stats.requests} requests, TTFB p50 {host_stats.ttfb.percentile(0.5):.0f} ms / "
+                                 f"p95 {host_stats.ttfb.percentile(0.95):.0f} ms, {host_stats.throughput / 1024 ** 2:.2f} MB/s, "
+                                 f"{sum(host_stats.errors.values())} errors, {host_stats.stalls} stalls", "yellow", 20)
\ No newline at end of file
@@ -4,7 +4,7 @@ import asyncio
 import copy
 from abc import ABC, abstractmethod
 from dataclasses import field
-from typing import TYPE_CHECKING, Optional, Union, Any
+from typing import TYPE_CHECKING, List, Optional, Tuple, Union, Any
 
 from bs4 import BeautifulSoup
 from yarl import URL
@@ -66,8 +66,13 @@ class Crawler(ABC):
         """Director for scraping"""
         raise NotImplementedError("Must override in child class")
 
-    async def handle_file(self, url: URL, scrape_item: ScrapeItem, filename: str, ext: str) -> None:
-        """Finishes handling the file and hands it off to the downloader"""
+    async def handle_file(self, url: URL, scrape_item: ScrapeItem, filename: str, ext: str, host_hash: Optional[str] = None,
+                          known_size: Optional[int] = None, completed: Optional[bool] = None) -> None:
+        """Finishes handling the file and hands it off to the downloader
+
+        host_hash is the file's hash from the host's API, prefixed with its algorithm ("md5:..."), if it gives one.
+        known_size is the file's size in bytes from the host's API, files outside the size limits are skipped without a request.
+        completed is whether the history has it, when it's already been looked up"""
         if self.domain in ['cyberdrop', 'bunkrr']:
             original_filename, filename = await remove_id(self.manager, filename, ext)
         else:
@@ -77,20 +82,42 @@ class Crawler(ABC):
         media_item = MediaItem(url, scrape_item.url, scrape_item.album_id, download_folder, filename, ext, original_filename)
         if scrape_item.possible_datetime:
             media_item.datetime = scrape_item.possible_datetime
+        media_item.host_hash = host_hash
+        media_item.known_size = known_size
 
-        check_complete = await self.manager.db_manager.history_table.check_complete(self.domain, url, scrape_item.url)
-        if check_complete:
+        if completed is None:
+            completed = await self.manager.db_manager.history_table.check_complete(self.domain, url, scrape_item.url)
+        if completed:
             if media_item.album_id:
                 await self.manager.db_manager.history_table.set_album_id(self.domain, media_item)
             await log(f"Skipping {url} as it has already been downloaded", 10)
             await self.manager.progress_manager.download_progress.add_previously_completed()
             return
 
+        if not await self.manager.download_manager.check_allowed_filetype(media_item):
+            await log(f"Download Skip {url} due to filetype restrictions", 10)
+            await self.manager.progress_manager.download_progress.update_total()
+            await self.manager.progress_manager.download_progress.add_skipped()
+            return
+        if known_size is not None and not await self.manager.download_manager.check_filesize_limits(media_item, known_size):
+            await log(f"Download Skip {url} due to filesize restrictions", 10)
+            await self.manager.progress_manager.download_progress.update_total()
+            await self.manager.progress_manager.download_progress.add_skipped()
+            return
+
         if await self.manager.download_manager.get_download_limit(self.domain) == 1:
             await self.downloader.run(media_item)
         else:
             self.manager.task_group.create_task(self.downloader.run(media_item))
 
+    async def handle_files(self, files: List[Tuple]) -> None:
+        """Hands off every file found on a page, looking them all up in the history with one query first
+
+        Each entry holds the arguments of handle_file for one file"""
+        completed = await self.manager.db_manager.history_table.check_complete_many(self.domain, [(file[0], file[1].url) for file in files])
+        for url, scrape_item, *args in files:
+            await self.handle_file(url, scrape_item, *args, completed=url in completed)
+
     """~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~"""
 
     async def check_post_number(self, post_number: int, current_post_number: int) -> (bool, bool):
@@ -140,7 +167,7 @@ class Crawler(ABC):
                     return
 
                 await asyncio.sleep(wait_time)
-                soup = BeautifulSoup(text, 'html.parser')
+                soup = BeautifulSoup(text, self.client.client_manager.html_parser)
 
                 inputs = soup.select('form input')
                 data = {
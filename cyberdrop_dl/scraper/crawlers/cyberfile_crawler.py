@@ -54,7 +54,7 @@ class CyberfileCrawler(Crawler):
             data = {"pageType": "folder", "nodeId": nodeId, "pageStart": page, "perPage": 0, "filterOrderBy": ""}
             async with self.request_limiter:
                 ajax_dict = await self.client.post_data(self.domain, self.api_files, data=data)
-                ajax_soup = BeautifulSoup(ajax_dict['html'].replace("\\", ""), 'html.parser')
+                ajax_soup = BeautifulSoup(ajax_dict['html'].replace("\\", ""), self.client.client_manager.html_parser)
             title = await self.create_title(ajax_dict['page_title'], scrape_item.url.parts[2], None)
             num_pages = int(ajax_soup.select("a[onclick*=loadImages]")[-1].get('onclick').split(',')[2].split(")")[0].strip())
 
@@ -92,7 +92,7 @@ class CyberfileCrawler(Crawler):
             data = {"pageType": "nonaccountshared", "nodeId": node_id, "pageStart": page, "perPage": 0, "filterOrderBy": ""}
             async with self.request_limiter:
                 ajax_dict = await self.client.post_data("cyberfile", self.api_files, data=data)
-                ajax_soup = BeautifulSoup(ajax_dict['html'].replace("\\", ""), 'html.parser')
+                ajax_soup = BeautifulSoup(ajax_dict['html'].replace("\\", ""), self.client.client_manager.html_parser)
             title = await self.create_title(ajax_dict['page_title'], scrape_item.url.parts[2], None)
             num_pages = int(ajax_soup.select_one('input[id=rspTotalPages]').get('value'))
 
@@ -144,7 +144,7 @@ class CyberfileCrawler(Crawler):
         data = {"u": contentId}
         async with self.request_limiter:
             ajax_dict = await self.client.post_data(self.domain, self.api_details, data=data)
-            ajax_soup = BeautifulSoup(ajax_dict['html'].replace("\\", ""), 'html.parser')
+            ajax_soup = BeautifulSoup(ajax_dict['html'].replace("\\", ""), self.client.client_manager.html_parser)
             
         if "albumPasswordModel" in ajax_dict['html']:
             await log(f"Album is password protected: {scrape_item.url}", 30)
@@ -71,6 +71,7 @@ class GoFileCrawler(Crawler):
         title = await self.create_title(JSON_Resp["name"], content_id, None)
 
         contents = JSON_Resp["children"]
+        files = []
         for content_id in contents:
             content = contents[content_id]
             if content["type"] == "folder":
@@ -92,7 +93,9 @@ class GoFileCrawler(Crawler):
             duplicate_scrape_item.possible_datetime = content["createTime"]
             duplicate_scrape_item.part_of_album = True
             await duplicate_scrape_item.add_to_parent_title(title)
-            await self.handle_file(link, duplicate_scrape_item, filename, ext)
+            host_hash = f"md5:{content['md5']}" if content.get("md5") else None
+            files.append((link, duplicate_scrape_item, filename, ext, host_hash, content.get("size")))
+        await self.handle_files(files)
 
     """~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~"""
 
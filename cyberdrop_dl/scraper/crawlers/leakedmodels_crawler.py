@@ -3,10 +3,10 @@ from __future__ import annotations
 from typing import TYPE_CHECKING
 
 from aiolimiter import AsyncLimiter
-from bs4 import Tag
 from yarl import URL
 
 from cyberdrop_dl.scraper.crawler import Crawler
+from cyberdrop_dl.scraper.forum_extractor import ExtractedPost, ForumPageExtractor
 from cyberdrop_dl.utils.dataclasses.url_objects import ScrapeItem
 from cyberdrop_dl.utils.utilities import get_filename_and_ext, error_handling_wrapper, log
 
@@ -46,6 +46,8 @@ class LeakedModelsCrawler(Crawler):
         self.attachments_selector = "a"
         self.attachments_attribute = "href"
 
+        self.page_extractor = ForumPageExtractor.from_crawler(self)
+
     """~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~"""
 
     async def fetch(self, scrape_item: ScrapeItem) -> None:
@@ -88,35 +90,25 @@ class LeakedModelsCrawler(Crawler):
         current_post_number = 0
         while True:
             async with self.request_limiter:
-                soup = await self.client.get_BS4(self.domain, thread_url)
-
-            title_block = soup.select_one(self.title_selector)
-            for elem in title_block.find_all(self.title_trash_selector):
-                elem.decompose()
+                page = await self.client.get_BS4_and_extract(self.domain, thread_url, self.page_extractor)
 
             thread_id = thread_url.parts[2].split('.')[-1]
-            title = await self.create_title(title_block.text.replace("\n", ""), None, thread_id)
+            title = await self.create_title(page.title, None, thread_id)
 
-            posts = soup.select(self.posts_selector)
-            for post in posts:
-                current_post_number = int(post.select_one(self.posts_number_selector).get(self.posts_number_attribute).split('/')[-1].split('post-')[-1])
+            for post in page.posts:
+                current_post_number = post.number
                 scrape_post, continue_scraping = await self.check_post_number(post_number, current_post_number)
 
                 if scrape_post:
-                    date = int(post.select_one(self.post_date_selector).get(self.post_date_attribute))
+                    date = int(post.date)
                     new_scrape_item = await self.create_scrape_item(scrape_item, thread_url, title, False, None, date)
-
-                    for elem in post.find_all(self.quotes_selector):
-                        elem.decompose()
-                    post_content = post.select_one(self.posts_content_selector)
-                    await self.post(new_scrape_item, post_content, current_post_number)
+                    await self.post(new_scrape_item, post, current_post_number)
 
                 if not continue_scraping:
                     break
 
-            next_page = soup.select_one(self.next_page_selector)
-            if next_page and continue_scraping:
-                thread_url = next_page.get(self.next_page_attribute)
+            if page.next_page and continue_scraping:
+                thread_url = page.next_page
                 if thread_url:
                     if thread_url.startswith("/"):
                         thread_url = self.primary_base_domain / thread_url[1:]
@@ -132,7 +124,7 @@ class LeakedModelsCrawler(Crawler):
         await self.manager.log_manager.write_last_post_log(last_post_url)
 
     @error_handling_wrapper
-    async def post(self, scrape_item: ScrapeItem, post_content: Tag, post_number: int) -> None:
+    async def post(self, scrape_item: ScrapeItem, post_content: ExtractedPost, post_number: int) -> None:
         """Scrapes a post"""
         if self.manager.config_manager.settings_data['Download_Options']['separate_posts']:
             scrape_item = await self.create_scrape_item(scrape_item, scrape_item.url, "")
@@ -145,12 +137,11 @@ class LeakedModelsCrawler(Crawler):
         await self.attachments(scrape_item, post_content)
 
     @error_handling_wrapper
-    async def links(self, scrape_item: ScrapeItem, post_content: Tag) -> None:
+    async def links(self, scrape_item: ScrapeItem, post_content: ExtractedPost) -> None:
         """Scrapes links from a post"""
         links = post_content.select(self.links_selector)
         for link_obj in links:
-            test_for_img = link_obj.select_one("img")
-            if test_for_img is not None:
+            if link_obj.contains_img:
                 continue
 
             link = link_obj.get(self.links_attribute)
@@ -181,7 +172,7 @@ class LeakedModelsCrawler(Crawler):
                 await log(f"Scrape Failed: encountered while handling {link}", 40)
 
     @error_handling_wrapper
-    async def images(self, scrape_item: ScrapeItem, post_content: Tag) -> None:
+    async def images(self, scrape_item: ScrapeItem, post_content: ExtractedPost) -> None:
         """Scrapes images from a post"""
         images = post_content.select(self.images_selector)
         for image in images:
@@ -209,7 +200,7 @@ class LeakedModelsCrawler(Crawler):
                 continue
 
     @error_handling_wrapper
-    async def videos(self, scrape_item: ScrapeItem, post_content: Tag) -> None:
+    async def videos(self, scrape_item: ScrapeItem, post_content: ExtractedPost) -> None:
         """Scrapes videos from a post"""
         videos = post_content.select(self.videos_selector)
         videos.extend(post_content.select(self.iframe_selector))
@@ -230,7 +221,7 @@ class LeakedModelsCrawler(Crawler):
             await self.handle_external_links(new_scrape_item)
 
     @error_handling_wrapper
-    async def embeds(self, scrape_item: ScrapeItem, post_content: Tag) -> None:
+    async def embeds(self, scrape_item: ScrapeItem, post_content: ExtractedPost) -> None:
         """Scrapes embeds from a post"""
         embeds = post_content.select(self.embeds_selector)
         for embed in embeds:
@@ -245,13 +236,9 @@ class LeakedModelsCrawler(Crawler):
             await self.handle_external_links(new_scrape_item)
 
     @error_handling_wrapper
-    async def attachments(self, scrape_item: ScrapeItem, post_content: Tag) -> None:
+    async def attachments(self, scrape_item: ScrapeItem, post_content: ExtractedPost) -> None:
         """Scrapes attachments from a post"""
-        attachment_block = post_content.select_one(self.attachments_block_selector)
-        if not attachment_block:
-            return
-
-        attachments = attachment_block.select(self.attachments_selector)
+        attachments = post_content.select(self.attachments_selector, self.attachments_block_selector)
         for attachment in attachments:
             link = attachment.get(self.attachments_attribute)
             if not link:
@@ -46,6 +46,7 @@ class PixelDrainCrawler(Crawler):
 
         title = await self.create_title(JSON_Resp['title'], scrape_item.url.parts[2], None)
 
+        files = []
         for file in JSON_Resp['files']:
             link = await self.create_download_link(file['id'])
             date = await self.parse_datetime(file['date_upload'].replace("T", " ").split(".")[0].strip("Z"))
@@ -58,7 +59,9 @@ class PixelDrainCrawler(Crawler):
                     raise NoExtensionFailure()
             new_scrape_item = await self.create_scrape_item(scrape_item, link, title, True, None, date)
             if not await self.check_album_results(link, results):
-                await self.handle_file(link, new_scrape_item, filename, ext)
+                host_hash = f"sha256:{file['hash_sha256']}" if file.get('hash_sha256') else None
+                files.append((link, new_scrape_item, filename, ext, host_hash, file.get('size')))
+        await self.handle_files(files)
 
     @error_handling_wrapper
     async def file(self, scrape_item: ScrapeItem) -> None:
@@ -76,7 +79,8 @@ class PixelDrainCrawler(Crawler):
             else:
                 raise NoExtensionFailure()
         new_scrape_item = await self.create_scrape_item(scrape_item, link, "", False, None, date)
-        await self.handle_file(link, new_scrape_item, filename, ext)
+        host_hash = f"sha256:{JSON_Resp['hash_sha256']}" if JSON_Resp.get('hash_sha256') else None
+        await self.handle_file(link, new_scrape_item, filename, ext, host_hash, JSON_Resp.get('size'))
 
     """~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~"""
 
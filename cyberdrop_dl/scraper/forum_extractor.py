@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from bs4 import BeautifulSoup, Tag
+
+    from cyberdrop_dl.scraper.crawler import Crawler
+
+
+@dataclass
+class ExtractedElement:
+    """Plain copy of the parts of an element the crawlers use, safe to send between processes"""
+    attrs: Dict
+    parent: Optional[ExtractedElement] = None
+    contains_img: bool = False
+
+    def get(self, key: str, default=None):
+        """Returns the value of an attribute, like Tag.get"""
+        return self.attrs.get(key, default)
+
+
+@dataclass
+class ExtractedPost:
+    """A forum post reduced to the elements matched by the crawler's selectors"""
+    number: int
+    date: Optional[str]
+    selections: Dict[Tuple[Optional[str], str], List[ExtractedElement]] = field(default_factory=dict)
+
+    def select(self, selector: str, scope: Optional[str] = None) -> List[ExtractedElement]:
+        """Returns the elements matched by a selector, optionally inside the first element matched by scope"""
+        return list(self.selections.get((scope, selector), []))
+
+
+@dataclass
+class ExtractedThreadPage:
+    """A forum thread page reduced to plain data"""
+    title: str
+    posts: List[ExtractedPost]
+    next_page: Optional[str]
+
+
+@dataclass(frozen=True)
+class ForumPageExtractor:
+    """Extracts the data the forum crawlers need from a thread page
+
+    Instances are picklable so the parsing and the selector work can run in the HTML parser worker pool"""
+    title_selector: str
+    title_trash_selector: str
+    posts_selector: str
+    posts_number_selector: str
+    posts_number_attribute: str
+    post_date_selector: str
+    post_date_attribute: str
+    posts_content_selector: str
+    quotes_selector: str
+    next_page_selector: str
+    next_page_attribute: str
+    content_selectors: Tuple[Tuple[Optional[str], str], ...]
+    decompose_quotes: bool = True
+
+    @classmethod
+    def from_crawler(cls, crawler: Crawler, extra_selectors: Tuple[str, ...] = (), decompose_quotes: bool = True) -> ForumPageExtractor:
+        """Builds the extractor from the selectors defined on a XenForo crawler"""
+        content_selectors = [(None, crawler.links_selector), (None, crawler.images_selector),
+                             (None, crawler.videos_selector), (None, crawler.iframe_selector),
+                             (None, crawler.embeds_selector),
+                             (crawler.attachments_block_selector, crawler.attachments_selector)]
+        content_selectors.extend((None, selector) for selector in extra_selectors)
+        return cls(crawler.title_selector, crawler.title_trash_selector, crawler.posts_selector,
+                   crawler.posts_number_selector, crawler.posts_number_attribute, crawler.post_date_selector,
+                   crawler.post_date_attribute, crawler.posts_content_selector, crawler.quotes_selector,
+                   crawler.next_page_selector, crawler.next_page_attribute, tuple(content_selectors), decompose_quotes)
+
+    def __call__(self, soup: BeautifulSoup) -> ExtractedThreadPage:
+        title_block = soup.select_one(self.title_selector)
+        for elem in title_block.find_all(self.title_trash_selector):
+            elem.decompose()
+        title = title_block.text.replace("\n", "")
+
+        posts = [self.extract_post(post) for post in soup.select(self.posts_selector)]
+
+        next_page = soup.select_one(self.next_page_selector)
+        next_page = next_page.get(self.next_page_attribute) if next_page else None
+        return ExtractedThreadPage(title, posts, next_page)
+
+    def extract_post(self, post: Tag) -> ExtractedPost:
+        """Extracts the number, date and content elements of a post"""
+        number = int(post.select_one(self.posts_number_selector).get(self.posts_number_attribute).split('/')[-1].split('post-')[-1])
+        date = post.select_one(self.post_date_selector)
+        extracted_post = ExtractedPost(number, date.get(self.post_date_attribute) if date else None)
+
+        if self.decompose_quotes:
+            for elem in post.find_all(self.quotes_selector):
+                elem.decompose()
+
+        post_content = post.select_one(self.posts_content_selector)
+        if not post_content:
+            return extracted_post
+
+        for scope, selector in self.content_selectors:
+            parent = post_content.select_one(scope) if scope else post_content
+            elements = parent.select(selector) if parent else []
+            extracted_post.selections[(scope, selector)] = [self.extract_element(elem) for elem in elements]
+        return extracted_post
+
+    @staticmethod
+    def extract_element(elem: Tag) -> ExtractedElement:
+        """Copies the attributes of an element and its parent"""
+        parent = ExtractedElement(dict(elem.parent.attrs)) if elem.parent else None
+        return ExtractedElement(dict(elem.attrs), parent, elem.find("img") is not None)
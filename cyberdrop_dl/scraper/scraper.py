@@ -313,6 +313,8 @@ class ScrapeMapper:
 
         if not links:
             await log("No valid links found.", 30)
+        self.manager.task_group.create_task(self.manager.client_manager.prewarm(
+            [(await self.get_rate_limit_domain(link), link) for link in links]))
         for link in links:
             item = ScrapeItem(url=link, parent_title="")
             self.manager.task_group.create_task(self.map_url(item))
@@ -341,6 +343,11 @@ class ScrapeMapper:
         except NoExtensionFailure:
             return False
 
+    async def get_rate_limit_domain(self, url: URL) -> str:
+        """Returns the domain whose rate limiter requests for a URL go through"""
+        key = next((key for key in self.mapping if url.host and key in url.host.lower()), None)
+        return self.existing_crawlers[key].domain if key in self.existing_crawlers else "other"
+
     async def map_url(self, scrape_item: ScrapeItem) -> None:
         """Maps URLs to their respective handlers"""
         if not scrape_item.url:
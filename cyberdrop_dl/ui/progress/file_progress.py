@@ -37,9 +37,9 @@ class FileProgress:
         self.type_str = "Files"
         self.progress_str = "[{color}]{description}"
         self.overflow_str = "[{color}]... And {number} Other {type_str}"
-        self.queue_str = "[{color}]... And {number} {type_str} In Download Queue"
+        self.queue_str = "[{color}]... And {number} {type_str} In Download Queue ({policy})"
         self.overflow_task_id = self.overflow.add_task(self.overflow_str.format(color=self.color, number=0, type_str=self.type_str), visible=False)
-        self.queue_task_id = self.queue.add_task(self.queue_str.format(color=self.color, number=0, type_str=self.type_str), visible=False)
+        self.queue_task_id = self.queue.add_task(self.queue_str.format(color=self.color, number=0, type_str=self.type_str, policy=""), visible=False)
 
         self.visible_tasks: List[TaskID] = []
         self.invisible_tasks: List[TaskID] = []
@@ -53,12 +53,7 @@ class FileProgress:
 
     async def get_queue_length(self) -> int:
         """Returns the number of tasks in the downloader queue"""
-        total = 0
-
-        for scraper in self.manager.scrape_mapper.existing_crawlers.values():
-            total += scraper.downloader.waiting_items
-
-        return total
+        return self.manager.download_manager.scheduler.queued
 
     async def redraw(self, passed=False) -> None:
         """Redraws the progress bar"""
@@ -78,7 +73,8 @@ class FileProgress:
 
         queue_length = await self.get_queue_length()
         if queue_length > 0:
-            self.queue.update(self.queue_task_id, description=self.queue_str.format(color=self.color, number=queue_length, type_str=self.type_str), visible=True)
+            policy = self.manager.download_manager.scheduler.policy.replace("_", " ")
+            self.queue.update(self.queue_task_id, description=self.queue_str.format(color=self.color, number=queue_length, type_str=self.type_str, policy=policy), visible=True)
         else:
             self.queue.update(self.queue_task_id, visible=False)
         
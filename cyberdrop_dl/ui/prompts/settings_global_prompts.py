@@ -7,6 +7,8 @@ from InquirerPy.base.control import Choice
 from InquirerPy.validator import EmptyInputValidator
 from rich.console import Console
 
+from cyberdrop_dl.downloader.download_scheduler import DOWNLOAD_PRIORITY_POLICIES
+
 if TYPE_CHECKING:
     from cyberdrop_dl.managers.manager import Manager
 
@@ -52,6 +54,9 @@ def edit_general_settings_prompt(manager: Manager) -> None:
     console.clear()
     console.print("Editing General Settings")
     allow_insecure_connections = inquirer.confirm("Allow insecure connections?", vi_mode=manager.vi_mode).execute()
+    preallocate_files = inquirer.confirm("Preallocate the full size of downloads on disk?",
+                                         default=manager.config_manager.global_settings_data['General']['preallocate_files'],
+                                         vi_mode=manager.vi_mode).execute()
     user_agent = inquirer.text(
         message="User Agent:",
         default=manager.config_manager.global_settings_data['General']['user_agent'],
@@ -86,14 +91,36 @@ def edit_general_settings_prompt(manager: Manager) -> None:
         float_allowed=False,
         vi_mode=manager.vi_mode,
     ).execute()
+    scrape_cache_size = inquirer.number(
+        message="Scrape Response Cache Size (in MB, 0 to disable):",
+        default=int(manager.config_manager.global_settings_data['General']['scrape_cache_size']),
+        float_allowed=False,
+        vi_mode=manager.vi_mode,
+    ).execute()
+    html_parser_workers = inquirer.number(
+        message="HTML Parser Worker Processes (0 to parse in the main process):",
+        default=int(manager.config_manager.global_settings_data['General']['html_parser_workers']),
+        float_allowed=False,
+        vi_mode=manager.vi_mode,
+    ).execute()
+    html_parser = inquirer.select(
+        message="HTML Parser:",
+        choices=["html.parser", "lxml"],
+        default=manager.config_manager.global_settings_data['General']['html_parser'],
+        vi_mode=manager.vi_mode,
+    ).execute()
 
     manager.config_manager.global_settings_data['General']['allow_insecure_connections'] = allow_insecure_connections
+    manager.config_manager.global_settings_data['General']['preallocate_files'] = preallocate_files
     manager.config_manager.global_settings_data['General']['user_agent'] = user_agent
     manager.config_manager.global_settings_data['General']['proxy'] = proxy
     manager.config_manager.global_settings_data['General']['flaresolverr'] = flaresolverr
     manager.config_manager.global_settings_data['General']['max_filename_length'] = int(max_filename_length)
     manager.config_manager.global_settings_data['General']['max_folder_name_length'] = int(max_folder_name_length)
     manager.config_manager.global_settings_data['General']['required_free_space'] = int(required_free_space)
+    manager.config_manager.global_settings_data['General']['scrape_cache_size'] = int(scrape_cache_size)
+    manager.config_manager.global_settings_data['General']['html_parser_workers'] = int(html_parser_workers)
+    manager.config_manager.global_settings_data['General']['html_parser'] = html_parser
 
 
 def edit_ui_settings_prompt(manager: Manager) -> None:
@@ -179,6 +206,72 @@ def edit_rate_limiting_settings_prompt(manager: Manager) -> None:
         float_allowed=False,
         vi_mode=manager.vi_mode,
     ).execute()
+    connection_limit = inquirer.number(
+        message="Maximum number of pooled connections:",
+        default=int(manager.config_manager.global_settings_data['Rate_Limiting_Options']['connection_limit']),
+        float_allowed=False,
+        vi_mode=manager.vi_mode,
+    ).execute()
+    connection_limit_per_host = inquirer.number(
+        message="Maximum number of pooled connections per host:",
+        default=int(manager.config_manager.global_settings_data['Rate_Limiting_Options']['connection_limit_per_host']),
+        float_allowed=False,
+        vi_mode=manager.vi_mode,
+    ).execute()
+    keepalive_timeout = inquirer.number(
+        message="Keep-alive timeout for idle connections (in seconds):",
+        default=int(manager.config_manager.global_settings_data['Rate_Limiting_Options']['keepalive_timeout']),
+        float_allowed=False,
+        vi_mode=manager.vi_mode,
+    ).execute()
+    dns_cache_ttl = inquirer.number(
+        message="DNS Cache TTL (in seconds):",
+        default=int(manager.config_manager.global_settings_data['Rate_Limiting_Options']['dns_cache_ttl']),
+        float_allowed=False,
+        vi_mode=manager.vi_mode,
+    ).execute()
+    max_segments_per_download = inquirer.number(
+        message="Maximum number of connections per large file download:",
+        default=int(manager.config_manager.global_settings_data['Rate_Limiting_Options']['max_segments_per_download']),
+        float_allowed=False,
+        vi_mode=manager.vi_mode,
+    ).execute()
+    segmented_download_threshold = inquirer.number(
+        message="Minimum file size to download over multiple connections (in MB):",
+        default=int(manager.config_manager.global_settings_data['Rate_Limiting_Options']['segmented_download_threshold']),
+        float_allowed=False,
+        vi_mode=manager.vi_mode,
+    ).execute()
+    read_chunk_size = inquirer.number(
+        message="Download Read Chunk Size (in KB):",
+        default=int(manager.config_manager.global_settings_data['Rate_Limiting_Options']['read_chunk_size']),
+        float_allowed=False,
+        vi_mode=manager.vi_mode,
+    ).execute()
+    write_buffer_size = inquirer.number(
+        message="Download Write Buffer Size (in MB):",
+        default=int(manager.config_manager.global_settings_data['Rate_Limiting_Options']['write_buffer_size']),
+        float_allowed=False,
+        vi_mode=manager.vi_mode,
+    ).execute()
+    stall_speed_floor = inquirer.number(
+        message="Speed below which a download is considered stalled and reconnected (in KB/s, 0 to disable):",
+        default=int(manager.config_manager.global_settings_data['Rate_Limiting_Options']['stall_speed_floor']),
+        float_allowed=False,
+        vi_mode=manager.vi_mode,
+    ).execute()
+    stall_window = inquirer.number(
+        message="Seconds a download must stay below that speed to be considered stalled:",
+        default=int(manager.config_manager.global_settings_data['Rate_Limiting_Options']['stall_window']),
+        float_allowed=False,
+        vi_mode=manager.vi_mode,
+    ).execute()
+    download_priority = inquirer.select(
+        message="Order to start queued downloads in:",
+        choices=list(DOWNLOAD_PRIORITY_POLICIES),
+        default=manager.config_manager.global_settings_data['Rate_Limiting_Options']['download_priority'],
+        vi_mode=manager.vi_mode,
+    ).execute()
 
     manager.config_manager.global_settings_data['Rate_Limiting_Options']['connection_timeout'] = int(connection_timeout)
     manager.config_manager.global_settings_data['Rate_Limiting_Options']['read_timeout'] = int(read_timeout)
@@ -187,3 +280,14 @@ def edit_rate_limiting_settings_prompt(manager: Manager) -> None:
     manager.config_manager.global_settings_data['Rate_Limiting_Options']['download_delay'] = float(throttle)
     manager.config_manager.global_settings_data['Rate_Limiting_Options']['max_simultaneous_downloads'] = int(max_simultaneous_downloads)
     manager.config_manager.global_settings_data['Rate_Limiting_Options']['max_simultaneous_downloads_per_domain'] = int(max_simultaneous_downloads_per_domain)
+    manager.config_manager.global_settings_data['Rate_Limiting_Options']['connection_limit'] = int(connection_limit)
+    manager.config_manager.global_settings_data['Rate_Limiting_Options']['connection_limit_per_host'] = int(connection_limit_per_host)
+    manager.config_manager.global_settings_data['Rate_Limiting_Options']['keepalive_timeout'] = int(keepalive_timeout)
+    manager.config_manager.global_settings_data['Rate_Limiting_Options']['dns_cache_ttl'] = int(dns_cache_ttl)
+    manager.config_manager.global_settings_data['Rate_Limiting_Options']['max_segments_per_download'] = int(max_segments_per_download)
+    manager.config_manager.global_settings_data['Rate_Limiting_Options']['segmented_download_threshold'] = int(segmented_download_threshold)
+    manager.config_manager.global_settings_data['Rate_Limiting_Options']['read_chunk_size'] = int(read_chunk_size)
+    manager.config_manager.global_settings_data['Rate_Limiting_Options']['write_buffer_size'] = int(write_buffer_size)
+    manager.config_manager.global_settings_data['Rate_Limiting_Options']['stall_speed_floor'] = int(stall_speed_floor)
+    manager.config_manager.global_settings_data['Rate_Limiting_Options']['stall_window'] = int(stall_window)
+    manager.config_manager.global_settings_data['Rate_Limiting_Options']['download_priority'] = download_priority
@@ -8,6 +8,7 @@ from InquirerPy.base.control import Choice
 from InquirerPy.validator import PathValidator, EmptyInputValidator, NumberValidator
 from rich.console import Console
 
+from cyberdrop_dl.managers.download_manager import DEDUPE_MODES
 from cyberdrop_dl.utils.dataclasses.supported_domains import SupportedDomains
 
 if TYPE_CHECKING:
@@ -113,6 +114,9 @@ def edit_download_options_prompt(manager: Manager, config: Dict) -> None:
             Choice(value="include_thread_id_in_folder_name",
                    name="Include Thread ID In Folder Name",
                    enabled=config["Download_Options"]["include_album_id_in_folder_name"]),
+            Choice(value="preflight_head_requests",
+                   name="Check Files With A HEAD Request Before Downloading",
+                   enabled=config["Download_Options"]["preflight_head_requests"]),
             Choice(value="remove_domains_from_folder_names",
                    name="Remove Domains From Folder Names",
                    enabled=config["Download_Options"]["remove_domains_from_folder_names"]),
@@ -132,12 +136,22 @@ def edit_download_options_prompt(manager: Manager, config: Dict) -> None:
         vi_mode=manager.vi_mode,
     ).execute()
 
+    dedupe_mode = inquirer.select(
+        message="What to do with a download that's identical to an earlier one:",
+        choices=list(DEDUPE_MODES),
+        default=config["Download_Options"]["dedupe_mode"],
+        long_instruction="hardlink / reflink replace it with a link to the earlier file, skip deletes it",
+        vi_mode=manager.vi_mode,
+    ).execute()
+
     for key in config["Download_Options"]:
         config["Download_Options"][key] = False
 
     for key in action:
         config["Download_Options"][key] = True
 
+    config["Download_Options"]["dedupe_mode"] = dedupe_mode
+
 
 def edit_input_output_file_paths_prompt(manager: Manager, config: Dict) -> None:
     """Edit the input / output file paths"""
@@ -333,6 +347,9 @@ def edit_runtime_options_prompt(manager: Manager, config: Dict) -> None:
             Choice(value="ignore_history",
                    name="Ignore the history (previously downloaded files)",
                    enabled=config["Runtime_Options"]["ignore_history"]),
+            Choice(value="history_membership_filter",
+                   name="Keep a filter of the history in memory to skip lookups of new files (slower startup on large histories)",
+                   enabled=config["Runtime_Options"]["history_membership_filter"]),
             Choice(value="skip_check_for_partial_files",
                    name="Skip checking for partial files in the download folder",
                    enabled=config["Runtime_Options"]["skip_check_for_partial_files"]),
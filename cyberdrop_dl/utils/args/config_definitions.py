@@ -57,11 +57,13 @@ settings: Dict = {
         "disable_file_timestamps": False,
         "include_album_id_in_folder_name": False,
         "include_thread_id_in_folder_name": False,
+        "preflight_head_requests": False,
         "remove_domains_from_folder_names": False,
         "remove_generated_id_from_filenames": False,
         "scrape_single_forum_post": False,
         "separate_posts": False,
         "skip_download_mark_completed": False,
+        "dedupe_mode": "off",
     },
     "Files": {
         "input_file": str(APP_STORAGE / "Configs" / "{config}" / "URLs.txt"),
@@ -94,6 +96,7 @@ settings: Dict = {
     },
     "Runtime_Options": {
         "ignore_history": False,
+        "history_membership_filter": False,
         "log_level": 10,
         "skip_check_for_partial_files": False,
         "skip_check_for_empty_folders": False,
@@ -122,6 +125,10 @@ global_settings: Dict = {
         "max_file_name_length": 95,
         "max_folder_name_length": 60,
         "required_free_space": 5,
+        "scrape_cache_size": 256,
+        "html_parser_workers": 0,
+        "html_parser": "html.parser",
+        "preallocate_files": True,
     },
     "Rate_Limiting_Options": {
         "connection_timeout": 15,
@@ -131,6 +138,17 @@ global_settings: Dict = {
         "download_delay": 0.5,
         "max_simultaneous_downloads": 15,
         "max_simultaneous_downloads_per_domain": 5,
+        "connection_limit": 100,
+        "connection_limit_per_host": 20,
+        "keepalive_timeout": 30,
+        "dns_cache_ttl": 300,
+        "max_segments_per_download": 4,
+        "segmented_download_threshold": 100,
+        "read_chunk_size": 1024,
+        "write_buffer_size": 4,
+        "stall_speed_floor": 10,
+        "stall_window": 30,
+        "download_priority": "fifo",
     },
     "UI_Options": {
         "vi_mode": False,
@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import itertools
+import time
+from collections import deque
+from dataclasses import field
+from typing import TYPE_CHECKING, Awaitable, Callable, Deque, Iterable
+
+from cyberdrop_dl.utils.utilities import log, log_debug
+
+if TYPE_CHECKING:
+    import aiosqlite
+
+Operation = Callable[["aiosqlite.Connection"], Awaitable[None]]
+
+
+class DBWriter:
+    """Runs every write to the database from a single task, grouping them into one transaction per batch
+
+    A batch is committed `flush_interval` seconds after its first write or once it holds `batch_size` writes, so
+    a download costs a share of one commit instead of several. Writes are committed in the order they're submitted"""
+    def __init__(self, db_conn: aiosqlite.Connection):
+        self.db_conn = db_conn
+        self.flush_interval = 0.25
+        self.batch_size = 500
+
+        self._pending: Deque[Operation] = deque()
+        self._lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task = field(init=False)
+        self._closing = False
+
+        # Writes are committed in submission order, so a write has been committed once `writes` reaches its number
+        self.submitted = 0
+        self.writes = 0
+        self.transactions = 0
+
+    async def startup(self) -> None:
+        """Starts the writer task"""
+        self._task = asyncio.create_task(self.run())
+
+    async def close(self) -> None:
+        """Stops the writer task and commits everything still queued"""
+        # The task is told to stop rather than cancelled, wait_for can swallow a cancellation that races a wakeup
+        self._closing = True
+        self._wakeup.set()
+        if isinstance(self._task, asyncio.Task):
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+        # A batch interrupted before its commit is still queued, it's rolled back and written again
+        await self.db_conn.rollback()
+        await self.flush()
+        await log_debug(f"History database writes: {self.writes} in {self.transactions} transactions", 10)
+
+    async def submit(self, operation: Operation) -> int:
+        """Queues an operation to run in the next transaction, returns its number in submission order"""
+        self._pending.append(operation)
+        self.submitted += 1
+        self._wakeup.set()
+        return self.submitted
+
+    async def execute(self, sql: str, parameters: Iterable = ()) -> int:
+        """Queues a statement to run in the next transaction, returns its number in submission order"""
+        async def operation(db_conn: aiosqlite.Connection) -> None:
+            await db_conn.execute(sql, parameters)
+        return await self.submit(operation)
+
+    async def run(self) -> None:
+        """Commits the queued writes in batches until closed"""
+        while not self._closing:
+            await self._wakeup.wait()
+            deadline = time.monotonic() + self.flush_interval
+            while not self._closing and len(self._pending) < self.batch_size and time.monotonic() < deadline:
+                self._wakeup.clear()
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self._wakeup.wait(), deadline - time.monotonic())
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                # The batch stays queued, it's rolled back and written again with the next one
+                await log(f"History database commit failed: {e}", 40)
+                with contextlib.suppress(Exception):
+                    await self.db_conn.rollback()
+
+    async def flush(self) -> None:
+        """Commits every queued write"""
+        async with self._lock:
+            while self._pending:
+                batch = list(itertools.islice(self._pending, self.batch_size))
+                for operation in batch:
+                    try:
+                        await operation(self.db_conn)
+                    except Exception as e:
+                        await log(f"History database write failed: {e}", 40)
+                await self.db_conn.commit()
+                for _ in batch:
+                    self._pending.popleft()
+                self.writes += len(batch)
+                self.transactions += 1
@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+import math
+from typing import Iterable, Iterator
+
+
+class MembershipFilter:
+    """Bloom filter of the files in the history, answers "maybe seen" or "definitely not seen" in ~10 bits per file
+
+    Keys added after it's built go in too, past its capacity the false positive rate rises but answers stay correct.
+    Positions come from Python's string hash, which is only stable within a run, the filter is rebuilt on every start"""
+    min_capacity = 100000
+
+    def __init__(self, capacity: int, bits_per_key: int = 10):
+        self.size = max(capacity, self.min_capacity) * bits_per_key
+        self.hash_count = max(round(bits_per_key * math.log(2)), 1)
+        self._bits = bytearray(-(-self.size // 8))
+        self.count = 0
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._bits)
+
+    @staticmethod
+    def make_key(domain: str, url_path: str) -> str:
+        return f"{domain}\x00{url_path}"
+
+    def _positions(self, key: str) -> Iterator[int]:
+        """Double hashing, every position is derived from two independent hashes of the key"""
+        position, step = hash(key) % self.size, (hash((key, self.size)) | 1) % self.size
+        for _ in range(self.hash_count):
+            yield position
+            position = (position + step) % self.size
+
+    def add(self, key: str) -> None:
+        self.update((key,))
+
+    def update(self, keys: Iterable[str]) -> None:
+        """Adds many keys, the positions are inlined as this is what building the filter spends its time on"""
+        bits, size, hash_count = self._bits, self.size, self.hash_count
+        for key in keys:
+            position, step = hash(key) % size, (hash((key, size)) | 1) % size
+            for _ in range(hash_count):
+                bits[position >> 3] |= 1 << (position & 7)
+                position = (position + step) % size
+            self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
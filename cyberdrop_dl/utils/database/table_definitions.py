@@ -23,3 +23,33 @@ create_fixed_history = """CREATE TABLE IF NOT EXISTS media_copy (domain TEXT,
                                                );"""
 
 create_temp = """CREATE TABLE IF NOT EXISTS temp (downloaded_filename TEXT);"""
+
+create_response_cache = """CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY,
+                                                       domain TEXT,
+                                                       url TEXT,
+                                                       response_url TEXT,
+                                                       etag TEXT,
+                                                       last_modified TEXT,
+                                                       body BLOB,
+                                                       size INTEGER NOT NULL,
+                                                       stored_at REAL NOT NULL,
+                                                       accessed_at REAL NOT NULL
+                                                       );"""
+
+create_history_indexes = ("""CREATE INDEX IF NOT EXISTS media_domain_referer ON media (domain, referer, completed);""",
+                          """CREATE INDEX IF NOT EXISTS media_domain_album_id ON media (domain, album_id, url_path, completed);""",
+                          """CREATE INDEX IF NOT EXISTS media_download_filename ON media (download_filename);""",
+                          """CREATE INDEX IF NOT EXISTS media_failed ON media (referer, download_path) WHERE completed = 0;""",
+                          """CREATE INDEX IF NOT EXISTS media_hash ON media (hash, file_size) WHERE hash IS NOT NULL;""",
+                          """CREATE INDEX IF NOT EXISTS media_host_hash ON media (host_hash) WHERE host_hash IS NOT NULL;""")
+
+# Lookups of the history table, none of them may fall back to scanning the whole table (tests/test_history_query_plans.py)
+history_lookup_queries = ("""SELECT referer, completed FROM media WHERE domain = ? and url_path = ?""",
+                          """SELECT url_path, referer FROM media WHERE domain = ? and completed != 0 and url_path IN (?, ?)""",
+                          """SELECT url_path, completed FROM media WHERE domain = ? and album_id = ?""",
+                          """SELECT completed FROM media WHERE domain = ? and referer = ?""",
+                          """SELECT EXISTS(SELECT 1 FROM media WHERE download_filename = ?)""",
+                          """SELECT download_filename FROM media WHERE domain = ? and url_path = ?""",
+                          """SELECT referer, download_path FROM media WHERE completed = 0""",
+                          """SELECT download_path, download_filename FROM media WHERE hash = ? and file_size = ? and completed = 1""",
+                          """SELECT download_path, download_filename, hash, file_size FROM media WHERE host_hash = ? and completed = 1""")
@@ -1,14 +1,19 @@
 from __future__ import annotations
 
+from dataclasses import dataclass
 from sqlite3 import Row, IntegrityError
 
 import aiosqlite
-from typing import TYPE_CHECKING, Iterable, Any
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Iterable, Any, List, Optional, Set, Tuple
 from yarl import URL
 
-from cyberdrop_dl.utils.database.table_definitions import create_history, create_fixed_history
+from cyberdrop_dl.utils.database.table_definitions import create_history, create_fixed_history, create_history_indexes
+from cyberdrop_dl.utils.database.membership_filter import MembershipFilter
+from cyberdrop_dl.utils.utilities import log
 
 if TYPE_CHECKING:
+    from cyberdrop_dl.utils.database.db_writer import DBWriter
     from cyberdrop_dl.utils.dataclasses.url_objects import MediaItem
 
 
@@ -33,18 +38,96 @@ async def get_db_domain(domain: str) -> str:
     return domain
 
 
+@dataclass
+class QueuedRow:
+    """A media row as it will be once the writer commits the changes queued for it"""
+    referer: str
+    album_id: Optional[str]
+    download_path: str
+    download_filename: str
+    completed: bool = False
+    file_size: Optional[int] = None
+    hash: Optional[str] = None
+    host_hash: Optional[str] = None
+    # Number of the last write queued for the row, it's in the database once the writer has committed that many
+    write_number: int = 0
+
+
 class HistoryTable:
-    def __init__(self, db_conn: aiosqlite.Connection):
+    """Lookups go through the read connection, changes are queued to the writer and committed in batches
+
+    Lookups never wait for the writer, rows with changes it hasn't committed yet are kept in memory and checked
+    alongside the read connection, so lookups always see the changes made earlier in the run.
+    The startup migrations run on the writer's connection before the writer starts"""
+    def __init__(self, db_conn: aiosqlite.Connection, writer: DBWriter):
         self.db_conn: aiosqlite.Connection = db_conn
+        self.read_conn: aiosqlite.Connection = db_conn
+        self.writer: DBWriter = writer
         self.ignore_history: bool = False
 
+        # Completed files, lookups of files it has never seen skip the database
+        self.membership: Optional[MembershipFilter] = None
+        self.membership_skips = 0
+
+        # Rows with uncommitted changes by (domain, url_path), ordered by their last queued write
+        self._queued: Dict[Tuple[str, str], QueuedRow] = {}
+
     async def startup(self) -> None:
         """Startup process for the HistoryTable"""
         await self.db_conn.execute(create_history)
         await self.db_conn.commit()
+        await self.migrate()
+
+    async def load_membership(self) -> None:
+        """Builds the in-memory filter of completed files from the database"""
+        result = await self.db_conn.execute("""SELECT COUNT(*) FROM media WHERE completed = 1""")
+        count = (await result.fetchone())[0]
+        # Room for the files this run adds before the false positive rate starts to rise
+        membership = MembershipFilter(count * 2)
+        cursor = await self.db_conn.execute("""SELECT domain, url_path FROM media WHERE completed = 1""")
+        while rows := await cursor.fetchmany(10000):
+            membership.update(MembershipFilter.make_key(domain, url_path) for domain, url_path in rows)
+        self.membership = membership
+
+    async def get_version(self) -> int:
+        """Returns the number of migrations the database has had, kept in its user_version"""
+        result = await self.db_conn.execute("""PRAGMA user_version""")
+        return (await result.fetchone())[0]
+
+    async def migrate(self) -> None:
+        """Runs the migrations the database hasn't had yet, recording each one so it only ever runs once"""
+        migrations = [self.migrate_to_v1]
+        version = await self.get_version()
+        for target_version, migration in enumerate(migrations[version:], version + 1):
+            await migration()
+            await self.db_conn.execute(f"""PRAGMA user_version = {target_version}""")
+            await self.db_conn.commit()
+            await log(f"History database migrated to version {target_version}", 20)
+
+    async def migrate_to_v1(self) -> None:
+        """Brings a database from before versioning up to date and indexes it"""
         await self.fix_primary_keys()
         await self.add_columns()
         await self.fix_bunkr_v4_entries()
+        await self.create_indexes()
+
+    async def queued_rows(self) -> Dict[Tuple[str, str], QueuedRow]:
+        """Returns the rows with changes the writer hasn't committed yet, dropping the ones it has"""
+        while self._queued:
+            key = next(iter(self._queued))
+            if self._queued[key].write_number > self.writer.writes:
+                break
+            del self._queued[key]
+        return self._queued
+
+    async def queue_row(self, domain: str, url_path: str, media_item: MediaItem) -> QueuedRow:
+        """Returns the queued row for a media item, starting one from the item if it has none, moved to the end"""
+        row = (await self.queued_rows()).pop((domain, url_path), None)
+        if row is None:
+            download_filename = media_item.download_filename if isinstance(media_item.download_filename, str) else ""
+            row = QueuedRow(str(media_item.referer), media_item.album_id, str(media_item.download_folder), download_filename)
+        self._queued[(domain, url_path)] = row
+        return row
 
     async def check_complete(self, domain: str, url: URL, referer: URL) -> bool:
         """Checks whether an individual file has completed given its domain and url path"""
@@ -54,35 +137,78 @@ class HistoryTable:
         domain = await get_db_domain(domain)
 
         url_path = await get_db_path(url, domain)
-        cursor = await self.db_conn.cursor()
+        if self.membership is not None and MembershipFilter.make_key(domain, url_path) not in self.membership:
+            self.membership_skips += 1
+            return False
+
+        row = (await self.queued_rows()).get((domain, url_path))
+        if row and row.completed:
+            return True
+        cursor = await self.read_conn.cursor()
         result = await cursor.execute("""SELECT referer, completed FROM media WHERE domain = ? and url_path = ?""", (domain, url_path))
         sql_file_check = await result.fetchone()
         if sql_file_check and sql_file_check[1] != 0:
             # Update the referer if it has changed so that check_complete_by_referer can work
             if str(referer) != sql_file_check[0]:
-                await cursor.execute("""UPDATE media SET referer = ? WHERE domain = ? and url_path = ?""", (str(referer), domain, url_path))
-                await self.db_conn.commit()
+                await self.writer.execute("""UPDATE media SET referer = ? WHERE domain = ? and url_path = ?""", (str(referer), domain, url_path))
             return True
         return False
     
+    async def check_complete_many(self, domain: str, urls: Iterable[Tuple[URL, URL]]) -> Set[URL]:
+        """Returns which of the (url, referer) pairs have completed, looking them up with one query per 500 urls"""
+        if self.ignore_history:
+            return set()
+
+        domain = await get_db_domain(domain)
+        candidates = {}
+        for url, referer in urls:
+            url_path = await get_db_path(url, domain)
+            if self.membership is not None and MembershipFilter.make_key(domain, url_path) not in self.membership:
+                self.membership_skips += 1
+                continue
+            candidates.setdefault(url_path, []).append((url, referer))
+
+        completed = set()
+        queued = await self.queued_rows()
+        for url_path in [url_path for url_path in candidates if (domain, url_path) in queued and queued[(domain, url_path)].completed]:
+            completed.update(url for url, _ in candidates.pop(url_path))
+        cursor = await self.read_conn.cursor()
+        url_paths = list(candidates)
+        for start in range(0, len(url_paths), 500):
+            chunk = url_paths[start:start + 500]
+            result = await cursor.execute(f"""SELECT url_path, referer FROM media WHERE domain = ? and completed != 0 and url_path IN ({', '.join('?' * len(chunk))})""",
+                                          (domain, *chunk))
+            for url_path, stored_referer in await result.fetchall():
+                for url, referer in candidates.pop(url_path, ()):
+                    completed.add(url)
+                    # Update the referer if it has changed so that check_complete_by_referer can work
+                    if str(referer) != stored_referer:
+                        await self.writer.execute("""UPDATE media SET referer = ? WHERE domain = ? and url_path = ?""", (str(referer), domain, url_path))
+        return completed
+
     async def check_album(self, domain: str, album_id: str) -> bool | dict[Any, Any]:
         """Checks whether an album has completed given its domain and album id"""
         if self.ignore_history:
             return False
 
         domain = await get_db_domain(domain)
-        cursor = await self.db_conn.cursor()
+        cursor = await self.read_conn.cursor()
         result = await cursor.execute("""SELECT url_path, completed FROM media WHERE domain = ? and album_id = ?""", (domain, album_id))
         result = await result.fetchall()
-        return {row[0]: row[1] for row in result}
+        album = {row[0]: row[1] for row in result}
+        for (row_domain, url_path), row in (await self.queued_rows()).items():
+            if row_domain == domain and row.album_id == album_id:
+                album[url_path] = album.get(url_path, 0) or int(row.completed)
+        return album
     
     async def set_album_id(self, domain: str, media_item: MediaItem) -> None:
         """Sets an album_id in the database"""
         domain = await get_db_domain(domain)
         url_path = await get_db_path(media_item.url, str(media_item.referer))
-        await self.db_conn.execute("""UPDATE media SET album_id = ? WHERE domain = ? and url_path = ?""",
-                                   (media_item.album_id, domain, url_path))
-        await self.db_conn.commit()
+        row = await self.queue_row(domain, url_path, media_item)
+        row.album_id = media_item.album_id
+        row.write_number = await self.writer.execute("""UPDATE media SET album_id = ? WHERE domain = ? and url_path = ?""",
+                                                     (media_item.album_id, domain, url_path))
 
     async def check_complete_by_referer(self, domain: str, referer: URL) -> bool:
         """Checks whether an individual file has completed given its domain and url path"""
@@ -90,7 +216,10 @@ class HistoryTable:
             return False
 
         domain = await get_db_domain(domain)
-        cursor = await self.db_conn.cursor()
+        if any(row_domain == domain and row.referer == str(referer) and row.completed
+               for (row_domain, _), row in (await self.queued_rows()).items()):
+            return True
+        cursor = await self.read_conn.cursor()
         result = await cursor.execute("""SELECT completed FROM media WHERE domain = ? and referer = ?""", (domain, str(referer)))
         sql_file_check = await result.fetchone()
         return sql_file_check and sql_file_check[0] != 0
@@ -100,28 +229,65 @@ class HistoryTable:
         domain = await get_db_domain(domain)
         url_path = await get_db_path(media_item.url, str(media_item.referer))
         download_filename = media_item.download_filename if isinstance(media_item.download_filename, str) else ""
-        try:
-            await self.db_conn.execute("""UPDATE media SET domain = ?, album_id = ? WHERE domain = 'no_crawler' and url_path = ? and referer = ?""", 
-                                       (domain, media_item.album_id, url_path, str(media_item.referer)))
-        except IntegrityError:
-            await self.db_conn.execute("""DELETE FROM media WHERE domain = 'no_crawler' and url_path = ?""", (url_path,))
-        await self.db_conn.execute("""INSERT OR IGNORE INTO media (domain, url_path, referer, album_id, download_path, download_filename, original_filename, completed, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)""",
-                                   (domain, url_path, str(media_item.referer), media_item.album_id, str(media_item.download_folder), download_filename, media_item.original_filename, 0))
-        await self.db_conn.execute("""UPDATE media SET download_filename = ? WHERE domain = ? and url_path = ?""",
-                                   (download_filename, domain, url_path))
-        await self.db_conn.commit()
+        album_id, referer, download_folder, original_filename = media_item.album_id, str(media_item.referer), str(media_item.download_folder), media_item.original_filename
+
+        async def insert(db_conn: aiosqlite.Connection) -> None:
+            try:
+                await db_conn.execute("""UPDATE media SET domain = ?, album_id = ? WHERE domain = 'no_crawler' and url_path = ? and referer = ?""",
+                                      (domain, album_id, url_path, referer))
+            except IntegrityError:
+                await db_conn.execute("""DELETE FROM media WHERE domain = 'no_crawler' and url_path = ?""", (url_path,))
+            await db_conn.execute("""INSERT OR IGNORE INTO media (domain, url_path, referer, album_id, download_path, download_filename, original_filename, completed, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)""",
+                                  (domain, url_path, referer, album_id, download_folder, download_filename, original_filename, 0))
+            await db_conn.execute("""UPDATE media SET download_filename = ? WHERE domain = ? and url_path = ?""",
+                                  (download_filename, domain, url_path))
+        row = await self.queue_row(domain, url_path, media_item)
+        row.download_filename = download_filename
+        row.write_number = await self.writer.submit(insert)
 
     async def mark_complete(self, domain: str, media_item: MediaItem) -> None:
-        """Mark a download as completed in the database"""
+        """Mark a download as completed in the database, along with its size and hashes when they're known"""
         domain = await get_db_domain(domain)
         url_path = await get_db_path(media_item.url, str(media_item.referer))
-        await self.db_conn.execute("""UPDATE media SET completed = 1, completed_at = CURRENT_TIMESTAMP WHERE domain = ? and url_path = ?""",
-                                   (domain, url_path))
-        await self.db_conn.commit()
+        file_size = media_item.filesize if isinstance(media_item.filesize, int) else None
+        if self.membership is not None:
+            self.membership.add(MembershipFilter.make_key(domain, url_path))
+        row = await self.queue_row(domain, url_path, media_item)
+        row.completed = True
+        row.file_size = file_size if file_size is not None else row.file_size
+        row.hash = media_item.content_hash or row.hash
+        row.host_hash = media_item.host_hash or row.host_hash
+        row.write_number = await self.writer.execute("""UPDATE media SET completed = 1, completed_at = CURRENT_TIMESTAMP, file_size = COALESCE(?, file_size), hash = COALESCE(?, hash), host_hash = COALESCE(?, host_hash) WHERE domain = ? and url_path = ?""",
+                                  (file_size, media_item.content_hash, media_item.host_hash, domain, url_path))
+
+    async def get_files_by_hash(self, content_hash: str, file_size: int) -> List[Path]:
+        """Returns the paths of completed downloads with the given content hash and size"""
+        cursor = await self.read_conn.cursor()
+        result = await cursor.execute("""SELECT download_path, download_filename FROM media WHERE hash = ? and file_size = ? and completed = 1""",
+                                      (content_hash, file_size))
+        paths = [Path(row[0]) / row[1] for row in await result.fetchall() if row[0] and row[1]]
+        for row in (await self.queued_rows()).values():
+            if row.completed and row.hash == content_hash and row.file_size == file_size and row.download_filename:
+                path = Path(row.download_path) / row.download_filename
+                if path not in paths:
+                    paths.append(path)
+        return paths
+
+    async def get_files_by_host_hash(self, host_hash: str) -> List[Tuple[Path, str, int]]:
+        """Returns the paths, content hashes and sizes of completed downloads with the given host hash"""
+        cursor = await self.read_conn.cursor()
+        result = await cursor.execute("""SELECT download_path, download_filename, hash, file_size FROM media WHERE host_hash = ? and completed = 1""",
+                                      (host_hash,))
+        files = {Path(row[0]) / row[1]: (Path(row[0]) / row[1], row[2], row[3]) for row in await result.fetchall() if row[0] and row[1]}
+        for row in (await self.queued_rows()).values():
+            if row.completed and row.host_hash == host_hash and row.download_filename:
+                path = Path(row.download_path) / row.download_filename
+                files[path] = (path, row.hash, row.file_size)
+        return list(files.values())
 
     async def check_filename_exists(self, filename: str) -> bool:
         """Checks whether a downloaded filename exists in the database"""
-        cursor = await self.db_conn.cursor()
+        cursor = await self.read_conn.cursor()
         result = await cursor.execute("""SELECT EXISTS(SELECT 1 FROM media WHERE download_filename = ?)""", (filename,))
         sql_file_check = await result.fetchone()
         return sql_file_check == 1
@@ -130,15 +296,18 @@ class HistoryTable:
         """Returns the downloaded filename from the database"""
         domain = await get_db_domain(domain)
         url_path = await get_db_path(media_item.url, str(media_item.referer))
-        cursor = await self.db_conn.cursor()
+        row = (await self.queued_rows()).get((domain, url_path))
+        if row and row.download_filename:
+            return row.download_filename
+        cursor = await self.read_conn.cursor()
         result = await cursor.execute("""SELECT download_filename FROM media WHERE domain = ? and url_path = ?""",
                                       (domain, url_path))
         sql_file_check = await result.fetchone()
         return sql_file_check[0] if sql_file_check else None
 
     async def get_failed_items(self) -> Iterable[Row]:
-        """Returns a list of failed items"""
-        cursor = await self.db_conn.cursor()
+        """Returns a list of failed items, it's only called before the run queues any changes"""
+        cursor = await self.read_conn.cursor()
         result = await cursor.execute("""SELECT referer, download_path FROM media WHERE completed = 0""")
         failed_files = await result.fetchall()
         return failed_files
@@ -154,12 +323,19 @@ class HistoryTable:
         for entry in bunkr_entries:
             entry = list(entry)
             entry[0] = "bunkrr"
-            await self.db_conn.execute("""INSERT or REPLACE INTO media VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""", entry)
+            await self.db_conn.execute(f"""INSERT or REPLACE INTO media VALUES ({', '.join('?' * len(entry))})""", entry)
         await self.db_conn.commit()
 
         await self.db_conn.execute("""DELETE FROM media WHERE domain = 'bunkr'""")
         await self.db_conn.commit()
 
+    async def create_indexes(self) -> None:
+        """Creates the indexes the lookups need"""
+        print("Indexing the history database: DO NOT EXIT THE PROGRAM")
+        for create_index in create_history_indexes:
+            await self.db_conn.execute(create_index)
+        await self.db_conn.commit()
+
     async def fix_primary_keys(self) -> None:
         cursor = await self.db_conn.cursor()
         result = await cursor.execute("""pragma table_info(media)""")
@@ -195,3 +371,15 @@ class HistoryTable:
         if "completed_at" not in current_cols:
             await self.db_conn.execute("""ALTER TABLE media ADD COLUMN completed_at TIMESTAMP""")
             await self.db_conn.commit()
+
+        if "file_size" not in current_cols:
+            await self.db_conn.execute("""ALTER TABLE media ADD COLUMN file_size INTEGER""")
+            await self.db_conn.commit()
+
+        if "hash" not in current_cols:
+            await self.db_conn.execute("""ALTER TABLE media ADD COLUMN hash TEXT""")
+            await self.db_conn.commit()
+
+        if "host_hash" not in current_cols:
+            await self.db_conn.execute("""ALTER TABLE media ADD COLUMN host_hash TEXT""")
+            await self.db_conn.commit()
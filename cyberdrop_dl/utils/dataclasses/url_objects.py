@@ -5,6 +5,8 @@ from typing import TYPE_CHECKING, Union
 from cyberdrop_dl.utils.utilities import sanitize_folder
 
 if TYPE_CHECKING:
+    import hashlib
+
     from rich.progress import TaskID
     from yarl import URL
 
@@ -23,7 +25,15 @@ class MediaItem:
         self.datetime: str = field(init=False)
         
         self.filesize: int = field(init=False)
+        # Size given by the host while scraping, so limits can be applied before any request is made
+        self.known_size: Union[int, None] = None
         self.current_attempt: int = field(init=False)
+
+        # Hash given by the host's API ("md5:...", "sha256:..."), and the hash of the content as it's written
+        self.host_hash: Union[str, None] = None
+        self.content_hash: Union[str, None] = None
+        self.hasher: "hashlib._Hash" = field(init=False)
+        self.hashed_bytes: int = 0
         
         self.partial_file: Path = field(init=False)
         self.complete_file: Path = field(init=False)
@@ -222,6 +222,8 @@ async def check_partials_and_empty_folders(manager: Manager):
         partial_downloads = manager.path_manager.download_dir.rglob("*.part")
         for file in partial_downloads:
             file.unlink(missing_ok=True)
+        for file in manager.path_manager.download_dir.rglob("*.part.segments"):
+            file.unlink(missing_ok=True)
     elif not manager.config_manager.settings_data['Runtime_Options']['skip_check_for_partial_files']:
         await log_with_color("Checking for partial downloads...", "yellow", 20)
         partial_downloads = any(f.is_file() for f in manager.path_manager.download_dir.rglob("*.part"))
@@ -0,0 +1,105 @@
+"""Measures how fast response bodies are copied to disk, and how many write calls that takes
+
+A file is served from a local aiohttp server and downloaded with the buffered copy the download client uses, and with
+the previous loop that wrote every chunk aiohttp handed out as it arrived.
+
+    poetry run python scripts/bench_download_writes.py --size 512
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import aiofiles
+import aiohttp
+from aiohttp import web
+
+from cyberdrop_dl.clients.download_client import DownloadClient
+from cyberdrop_dl.utils.args.config_definitions import global_settings
+
+PORT = 8765
+
+
+class CountingFile:
+    """Counts the write calls made to an aiofiles file"""
+    def __init__(self, f):
+        self.f = f
+        self.writes = 0
+
+    async def write(self, data) -> int:
+        self.writes += 1
+        return await self.f.write(data)
+
+
+async def chunk_writes(content: aiohttp.StreamReader, f: CountingFile, on_write) -> None:
+    """The previous copy loop, one write per chunk"""
+    async for chunk, _ in content.iter_chunks():
+        await asyncio.sleep(0)
+        await f.write(chunk)
+        await on_write(chunk)
+
+
+async def buffered_writes(content: aiohttp.StreamReader, f: CountingFile, on_write, args: argparse.Namespace) -> None:
+    """The download client's copy loop, through reusable write buffers"""
+    client = SimpleNamespace(_write_buffers=[], client_manager=SimpleNamespace(
+        read_chunk_size=args.read_chunk_size * 1024, write_buffer_size=args.write_buffer_size * 1024 ** 2,
+        stall_speed_floor=args.stall_speed_floor * 1024, stall_window=args.stall_window))
+    await DownloadClient._write_content(client, f, content, on_write)
+
+
+async def download(session: aiohttp.ClientSession, dest: Path, copy) -> tuple[float, int, int]:
+    """Downloads the served file with a copy loop, returns the seconds taken, bytes written and write calls made"""
+    written = 0
+
+    async def on_write(block) -> None:
+        nonlocal written
+        written += len(block)
+
+    dest.unlink(missing_ok=True)
+    started = time.perf_counter()
+    async with session.get(f"http://127.0.0.1:{PORT}/file") as resp:
+        async with aiofiles.open(dest, mode='ab') as f:
+            counting_file = CountingFile(f)
+            await copy(resp.content, counting_file, on_write)
+    return time.perf_counter() - started, written, counting_file.writes
+
+
+async def main() -> None:
+    options = global_settings['Rate_Limiting_Options']
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=512, help="size of the served file in MB")
+    parser.add_argument("--runs", type=int, default=3, help="downloads per copy loop, the fastest is reported")
+    parser.add_argument("--read-chunk-size", type=int, default=options['read_chunk_size'], help="KB")
+    parser.add_argument("--write-buffer-size", type=int, default=options['write_buffer_size'], help="MB")
+    parser.add_argument("--stall-speed-floor", type=int, default=options['stall_speed_floor'], help="KB/s, 0 disables")
+    parser.add_argument("--stall-window", type=int, default=options['stall_window'], help="seconds")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        source, dest = Path(temp_dir) / "source.bin", Path(temp_dir) / "dest.bin"
+        with open(source, 'wb') as f:
+            for _ in range(args.size):
+                f.write(os.urandom(1024 ** 2))
+
+        app = web.Application()
+        app.router.add_get("/file", lambda request: web.FileResponse(source))
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", PORT).start()
+        try:
+            async with aiohttp.ClientSession() as session:
+                for name, copy in (("chunk writes", chunk_writes),
+                                   ("buffered writes", lambda content, f, on_write: buffered_writes(content, f, on_write, args))):
+                    seconds, written, writes = min([await download(session, dest, copy) for _ in range(args.runs)])
+                    print(f"{name:>16}: {written / 1024 ** 2 / seconds:8.1f} MB/s, {writes * 1024 ** 3 / written:8.0f} writes per GB")
+        finally:
+            await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
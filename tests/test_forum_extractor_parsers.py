@@ -0,0 +1,37 @@
+"""The forum crawlers must extract the same data from a thread page whichever HTML parser is configured"""
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+from cyberdrop_dl.clients.scraper_client import parse_and_extract
+from cyberdrop_dl.scraper.crawlers.celebforum_crawler import CelebForumCrawler
+from cyberdrop_dl.scraper.crawlers.f95zone_crawler import F95ZoneCrawler
+from cyberdrop_dl.scraper.crawlers.leakedmodels_crawler import LeakedModelsCrawler
+from cyberdrop_dl.scraper.crawlers.nudostar_crawler import NudoStarCrawler
+from cyberdrop_dl.scraper.crawlers.simpcity_crawler import SimpCityCrawler
+from cyberdrop_dl.scraper.crawlers.socialmediagirls_crawler import SocialMediaGirlsCrawler
+from cyberdrop_dl.scraper.crawlers.xbunker_crawler import XBunkerCrawler
+
+pytest.importorskip("lxml")
+
+# The crawlers only need a manager to build their extractor for reading its progress bars
+MANAGER = SimpleNamespace(progress_manager=SimpleNamespace(scraping_progress=None))
+
+FIXTURES = Path(__file__).parent / "fixtures" / "xenforo"
+# Saved thread pages per post number markup, "list" puts the u-concealed class on the <li>, "anchor" on the <a>
+CRAWLERS = {CelebForumCrawler: "list", F95ZoneCrawler: "anchor", LeakedModelsCrawler: "list", NudoStarCrawler: "anchor",
+            SimpCityCrawler: "list", SocialMediaGirlsCrawler: "list", XBunkerCrawler: "list"}
+CASES = [(crawler_class, fixture) for crawler_class, layout in CRAWLERS.items()
+         for fixture in sorted((FIXTURES / layout).glob("*.html"))]
+
+
+@pytest.mark.parametrize("crawler_class, fixture", CASES,
+                         ids=[f"{crawler_class.__name__}-{fixture.stem}" for crawler_class, fixture in CASES])
+def test_lxml_matches_html_parser(crawler_class: type, fixture: Path) -> None:
+    extractor = crawler_class(MANAGER).page_extractor
+    text = fixture.read_text(encoding="utf-8")
+
+    expected = parse_and_extract(text, extractor, "html.parser")
+    assert expected.posts and any(post.selections[extractor.content_selectors[0]] for post in expected.posts)
+    assert parse_and_extract(text, extractor, "lxml") == expected
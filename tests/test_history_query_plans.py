@@ -0,0 +1,32 @@
+"""Every history lookup must be answered from an index, a full scan of the media table grows with the whole history"""
+import asyncio
+
+import aiosqlite
+import pytest
+
+from cyberdrop_dl.utils.database.db_writer import DBWriter
+from cyberdrop_dl.utils.database.table_definitions import history_lookup_queries
+from cyberdrop_dl.utils.database.tables.history_table import HistoryTable
+
+
+@pytest.fixture(scope="module")
+def query_plans() -> dict:
+    """Plans every lookup against a history database brought up to date by the startup migrations"""
+    async def plan() -> dict:
+        db_conn = await aiosqlite.connect(":memory:")
+        try:
+            await HistoryTable(db_conn, DBWriter(db_conn)).startup()
+            plans = {}
+            for query in history_lookup_queries:
+                result = await db_conn.execute(f"""EXPLAIN QUERY PLAN {query}""", (None,) * query.count("?"))
+                plans[query] = [row[3] for row in await result.fetchall()]
+            return plans
+        finally:
+            await db_conn.close()
+    return asyncio.run(plan())
+
+
+@pytest.mark.parametrize("query", history_lookup_queries)
+def test_lookup_does_not_scan_media(query_plans: dict, query: str) -> None:
+    scans = [detail for detail in query_plans[query] if detail.startswith("SCAN media") and "INDEX" not in detail]
+    assert not scans, f"{query} plans {scans}"